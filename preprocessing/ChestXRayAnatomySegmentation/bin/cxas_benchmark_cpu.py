@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import time
+
+import torch
+
+from cxas.file_io import FileLoader
+from cxas.models import get_model, optimize_for_cpu
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Name and keyword arguments of optimize_for_cpu for every benchmarked mode,
+# None is the unmodified eager fp32 model
+MODES = [
+    ("eager_fp32", None),
+    ("channels_last", {"channels_last": True}),
+    ("channels_last_bf16", {"channels_last": True, "bf16": True}),
+    ("trace", {"channels_last": True, "jit": "trace"}),
+    ("trace_bf16", {"channels_last": True, "bf16": True, "jit": "trace"}),
+    ("compile", {"channels_last": True, "jit": "compile"}),
+    ("compile_bf16", {"channels_last": True, "bf16": True, "jit": "compile"}),
+]
+
+def parse_arguments() -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Compare CPU inference modes of the CXAS segmentation model."
+    )
+
+    parser.add_argument(
+        "-i", "--input",
+        metavar="filepath",
+        type=str,
+        default=None,
+        help="Image used for the benchmark, random data if not given."
+    )
+
+    parser.add_argument(
+        "-m", "--model",
+        choices=["UNet_ResNet50_default"],
+        default="UNet_ResNet50_default",
+        help="Model used for inference."
+    )
+
+    parser.add_argument(
+        "-bs", "--batch_size",
+        type=int,
+        default=4,
+        help="Number of images per forward pass."
+    )
+
+    parser.add_argument(
+        "-n", "--iterations",
+        type=int,
+        default=10,
+        help="Number of timed forward passes per mode."
+    )
+
+    parser.add_argument(
+        "--num_threads",
+        type=int,
+        default=None,
+        help="Number of intra-op threads."
+    )
+
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        choices=[name for name, _ in MODES],
+        default=[name for name, _ in MODES],
+        help="Modes to benchmark."
+    )
+
+    return parser.parse_args()
+
+def dice(pred: torch.Tensor, target: torch.Tensor) -> float:
+    """Mean Dice agreement of two multi-label segmentations."""
+    pred, target = pred.flatten(2).float(), target.flatten(2).float()
+    intersection = (pred * target).sum(-1)
+    total = pred.sum(-1) + target.sum(-1)
+    score = torch.where(total > 0, 2 * intersection / total.clamp(min=1), torch.ones_like(total))
+    return score.mean().item()
+
+def main() -> None:
+    """Main entry point for the script."""
+    args = parse_arguments()
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+
+    if args.input is not None:
+        data = FileLoader("cpu").load_file(args.input)["data"]
+    else:
+        data = torch.randn(1, 3, 512, 512)
+    batch = {"data": data.repeat(args.batch_size, 1, 1, 1)}
+
+    reference = None
+    for name, options in MODES:
+        if name not in args.modes and name != "eager_fp32":
+            continue
+        model = get_model(args.model, "cpu").eval()
+        if options is not None:
+            model = optimize_for_cpu(model, input_size=data.shape[-1], **options)
+
+        with torch.no_grad():
+            # Warm-up passes, also triggers compilation
+            for _ in range(2):
+                out = model(batch)
+            start = time.time()
+            for _ in range(args.iterations):
+                out = model(batch)
+            seconds = (time.time() - start) / args.iterations
+
+        if reference is None:
+            reference = out["segmentation_preds"]
+        if name in args.modes:
+            logging.info(
+                f"{name:>20}: {seconds * 1000:8.1f} ms/batch, "
+                f"{args.batch_size / seconds:6.2f} images/s, "
+                f"dice vs eager_fp32 {dice(out['segmentation_preds'], reference):.4f}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ import os
 from pathlib import Path
 
 from cxas import CXAS
+from cxas.file_io import shard_file_list
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -44,7 +45,105 @@ def parse_arguments() -> argparse.Namespace:
         help="Model used for inference."
     )
 
-    return parser.parse_args()
+    parser.add_argument(
+        "-b", "--basepath",
+        type=str,
+        default=None,
+        help="Directory the paths in the text file are relative to."
+    )
+
+    parser.add_argument(
+        "-bs", "--batch_size",
+        type=int,
+        default=8,
+        help="Number of images per forward pass."
+    )
+
+    parser.add_argument(
+        "-w", "--num_workers",
+        type=int,
+        default=4,
+        help="Number of dataloader workers decoding images ahead of the model."
+    )
+
+    parser.add_argument(
+        "--prefetch_factor",
+        type=int,
+        default=2,
+        help="Number of batches prefetched by each dataloader worker."
+    )
+
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        help="File recording processed inputs, defaults to '<input>.shard<index>.done'."
+    )
+
+    parser.add_argument(
+        "--num_shards",
+        type=int,
+        default=1,
+        help="Number of processes the file list is split across."
+    )
+
+    parser.add_argument(
+        "--shard_index",
+        type=int,
+        default=0,
+        help="Index of the shard processed by this process."
+    )
+
+    parser.add_argument(
+        "--no_skip_existing",
+        action="store_true",
+        help="Reprocess files whose output already exists."
+    )
+
+    parser.add_argument(
+        "--cpu_bf16",
+        action="store_true",
+        help="Run CPU inference under bfloat16 autocast."
+    )
+
+    parser.add_argument(
+        "--cpu_jit",
+        choices=["trace", "compile"],
+        default=None,
+        help="Export the model graph for CPU inference."
+    )
+
+    parser.add_argument(
+        "--num_threads",
+        type=int,
+        default=None,
+        help="Number of intra-op threads used for CPU inference."
+    )
+
+    parser.add_argument(
+        "--tile_base_size",
+        type=int,
+        default=None,
+        help="Segment images resized to this size in overlapping tiles, 0 keeps the native resolution (requires batch size 1). Only the thresholded masks are computed, not logits or features."
+    )
+
+    parser.add_argument(
+        "--tile_size",
+        type=int,
+        default=512,
+        help="Size of the tiles used with --tile_base_size."
+    )
+
+    parser.add_argument(
+        "--dicom_window",
+        action="store_true",
+        help="Scale DICOMs with their window center/width tags instead of min-max."
+    )
+
+    args = parser.parse_args()
+    if args.tile_base_size == 0 and args.batch_size != 1:
+        parser.error("--tile_base_size 0 keeps images at different sizes and requires --batch_size 1")
+    return args
 
 def process_path(model, path: Path, output_type: str) -> None:
     """Process a single file or directory."""
@@ -59,25 +158,64 @@ def process_path(model, path: Path, output_type: str) -> None:
     else:
         logging.error(f"{path} is neither a file nor a directory.")
 
+def process_file_list(model, input_path: Path, args: argparse.Namespace) -> None:
+    """Process the shard of a text file of paths assigned to this process."""
+    with open(input_path, 'r') as f:
+        files = [line.strip() for line in f if len(line.strip()) > 0]
+    files = shard_file_list(files, args.num_shards, args.shard_index)
+
+    manifest = args.manifest
+    if manifest is None:
+        manifest = f"{input_path}.shard{args.shard_index}.done"
+    logging.info(
+        f"Shard {args.shard_index}/{args.num_shards}: {len(files)} files, manifest {manifest}"
+    )
+
+    stats = model.process_file_list(
+        files,
+        storage_type=args.output_type,
+        batch_size=args.batch_size,
+        num_workers=args.num_workers,
+        prefetch_factor=args.prefetch_factor,
+        basepath=args.basepath,
+        manifest_path=manifest,
+        skip_existing=not args.no_skip_existing,
+    )
+    logging.info(
+        f"Processed {stats['processed']}, skipped {stats['skipped']}, failed {stats['failed']} "
+        f"in {stats['seconds']:.1f}s ({stats['images_per_second']:.2f} images/s)"
+    )
+
 def main() -> None:
     """Main entry point for the script."""
     args = parse_arguments()
-    model = CXAS(model_name=args.model, gpus=args.gpus)
+    cpu_options = None
+    if args.gpus == "cpu":
+        cpu_options = {
+            "bf16": args.cpu_bf16,
+            "jit": args.cpu_jit,
+            "num_threads": args.num_threads,
+        }
+    tile_options = None
+    if args.tile_base_size is not None:
+        tile_options = {
+            "base_size": args.tile_base_size if args.tile_base_size > 0 else None,
+            "tile_size": args.tile_size,
+        }
+    model = CXAS(
+        model_name=args.model,
+        gpus=args.gpus,
+        cpu_options=cpu_options,
+        tile_options=tile_options,
+        use_dicom_window=args.dicom_window,
+    )
     print("Model loaded")
-    basepath="/home/thiras3/workspace/s3bucket/mimic-cxr-jpg-2.1.0.physionet.org"
 
     input_path = Path(args.input)
 
     if input_path.is_file() and input_path.suffix == '.txt':
         logging.info(f"Processing input file list from: {input_path}")
-        with open(input_path, 'r') as f:
-            for line in f:
-                path = Path(line.strip())
-                fpath = os.path.join(basepath,path)
-                if fpath is not None:
-                    process_path(model, fpath, args.output_type)
-                else:
-                    logging.warning(f"Path does not exist: {path}")
+        process_file_list(model, input_path, args)
     elif input_path.exists():
         process_path(model, input_path, args.output_type)
     else:
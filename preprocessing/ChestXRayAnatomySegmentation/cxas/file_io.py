@@ -20,24 +20,52 @@ from pathlib import Path
 
 this_directory = Path(__file__).parent
 
+# Errors of FileLoader.load_file on missing, truncated, undecodable or unsupported files:
+# PIL raises OSError, SimpleITK RuntimeError, and unsupported inputs fail its assertions
+READ_ERRORS = (OSError, RuntimeError, ValueError, AssertionError)
+
 
 class FolderDataset(Dataset):
     """
     Dataset class to load images from a folder.
     """
 
-    def __init__(self, path: str, gpus: str):
+    def __init__(
+        self,
+        path: str,
+        gpus: str,
+        base_size: int = 512,
+        defer_normalization: bool = False,
+        use_dicom_window: bool = False,
+    ):
         """
         Initialize the FolderDataset.
 
         Args:
             path (str): Path to the folder containing images.
             gpus (str): GPU(s) to use for processing.
+            base_size (int, optional): Size images are resized to. Defaults to 512.
+            defer_normalization (bool, optional): Leave normalization to FileLoader.prepare_batch.
+            use_dicom_window (bool, optional): Scale DICOMs with their window tags.
+        """
+        super(FolderDataset, self).__init__()
+        self.fileloader = FileLoader(
+            "", base_size, defer_normalization, use_dicom_window
+        )
+        self.files = self.list_files(path)
+
+    def list_files(self, path):
+        """
+        List the images of the dataset.
+
+        Args:
+            path (str): Path to the folder containing images.
+
+        Returns:
+            list: Paths of the jpg, png and dcm files in the folder.
         """
-        super(Dataset, self).__init__()
         file_types = ["jpg", "png", "dcm"]
-        self.fileloader = FileLoader("")
-        self.files = [
+        return [
             os.path.join(path, i)
             for i in os.listdir(path)
             if i.split(".")[-1].lower() in file_types
@@ -92,7 +120,12 @@ class FolderDataset(Dataset):
 
 
 def get_folder_loader(
-    path: str, gpus: str, batch_size: int
+    path: str,
+    gpus: str,
+    batch_size: int,
+    base_size: int = 512,
+    defer_normalization: bool = False,
+    use_dicom_window: bool = False,
 ) -> torch.utils.data.DataLoader:
     """
     Get DataLoader for a folder dataset.
@@ -101,11 +134,18 @@ def get_folder_loader(
         path (str): Path to the folder containing images.
         gpus (str): GPU(s) to use for processing.
         batch_size (int): Batch size.
+        base_size (int, optional): Size images are resized to, None keeps the native resolution and requires batch_size 1. Defaults to 512.
+        defer_normalization (bool, optional): Leave normalization to FileLoader.prepare_batch.
+        use_dicom_window (bool, optional): Scale DICOMs with their window tags.
 
     Returns:
         torch.utils.data.DataLoader: DataLoader for the folder dataset.
     """
-    dataset = FolderDataset(path, gpus)
+    # Images kept at their native resolution have different sizes and cannot be stacked
+    assert base_size is not None or batch_size == 1, "base_size None requires batch_size 1"
+    dataset = FolderDataset(
+        path, gpus, base_size, defer_normalization, use_dicom_window
+    )
     loader = torch.utils.data.DataLoader(
         dataset,
         batch_size=batch_size,
@@ -116,19 +156,213 @@ def get_folder_loader(
     return loader
 
 
+class FileListDataset(FolderDataset):
+    """
+    Dataset class to load images from an explicit list of file paths.
+
+    Files that cannot be read are returned without data and dropped by the collate
+    function, so a single corrupt image does not abort a bulk run.
+    """
+
+    def __init__(
+        self,
+        files: list,
+        basepath: str = None,
+        base_size: int = 512,
+        defer_normalization: bool = False,
+        use_dicom_window: bool = False,
+    ):
+        """
+        Initialize the FileListDataset.
+
+        Args:
+            files (list): Paths of the images to load.
+            basepath (str, optional): Directory the paths in files are relative to.
+            base_size (int, optional): Size images are resized to. Defaults to 512.
+            defer_normalization (bool, optional): Leave normalization to FileLoader.prepare_batch.
+            use_dicom_window (bool, optional): Scale DICOMs with their window tags.
+        """
+        self.basepath = basepath
+        super(FileListDataset, self).__init__(
+            files, "", base_size, defer_normalization, use_dicom_window
+        )
+
+    def list_files(self, files):
+        """
+        List the images of the dataset.
+
+        Args:
+            files (list): Paths of the images to load.
+
+        Returns:
+            list: The paths, joined to basepath if given.
+        """
+        return [
+            os.path.join(self.basepath, i) if self.basepath is not None else i
+            for i in files
+        ]
+
+    def collate_fn(self, batch):
+        """
+        Custom collate function for batching, skipping unreadable files.
+
+        Args:
+            batch: List of samples to batch.
+
+        Returns:
+            dict: Batched data, with the paths of unreadable files under 'failed'.
+        """
+        failed = [b["filename"] for b in batch if "file_size" not in b.keys()]
+        batch = [b for b in batch if "file_size" in b.keys()]
+        out_dict = super().collate_fn(batch) if len(batch) > 0 else {}
+        out_dict["failed"] = failed
+        return out_dict
+
+    def __getitem__(self, index):
+        """
+        Get a sample from the dataset.
+
+        Args:
+            index (int): Index of the sample.
+
+        Returns:
+            dict: Sample data, or only the filename if the file could not be read.
+        """
+        try:
+            return self.fileloader.load_file(self.files[index])
+        except READ_ERRORS:
+            return {"filename": self.files[index]}
+
+
+def get_file_list_loader(
+    files: list,
+    gpus: str,
+    batch_size: int,
+    num_workers: int = 4,
+    prefetch_factor: int = 2,
+    basepath: str = None,
+    base_size: int = 512,
+    defer_normalization: bool = False,
+    use_dicom_window: bool = False,
+) -> torch.utils.data.DataLoader:
+    """
+    Get DataLoader for an explicit list of files.
+
+    Args:
+        files (list): Paths of the images to load.
+        gpus (str): GPU(s) to use for processing.
+        batch_size (int): Batch size.
+        num_workers (int, optional): Number of loader worker processes. Defaults to 4.
+        prefetch_factor (int, optional): Batches prefetched per worker. Defaults to 2.
+        basepath (str, optional): Directory the paths in files are relative to.
+        base_size (int, optional): Size images are resized to, None keeps the native resolution and requires batch_size 1. Defaults to 512.
+        defer_normalization (bool, optional): Leave normalization to FileLoader.prepare_batch.
+        use_dicom_window (bool, optional): Scale DICOMs with their window tags.
+
+    Returns:
+        torch.utils.data.DataLoader: DataLoader for the file list dataset.
+    """
+    # Images kept at their native resolution have different sizes and cannot be stacked
+    assert base_size is not None or batch_size == 1, "base_size None requires batch_size 1"
+    dataset = FileListDataset(
+        files, basepath, base_size, defer_normalization, use_dicom_window
+    )
+    loader = torch.utils.data.DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=False,
+        num_workers=num_workers,
+        prefetch_factor=prefetch_factor if num_workers > 0 else None,
+        persistent_workers=num_workers > 0,
+        pin_memory=torch.cuda.is_available() and "cpu" not in gpus,
+        collate_fn=dataset.collate_fn,
+    )
+    return loader
+
+
+def shard_file_list(files: list, num_shards: int = 1, shard_index: int = 0) -> list:
+    """
+    Select the files assigned to one shard of a bulk run.
+
+    Files are assigned round-robin, so every shard gets a similar mix of the list.
+
+    Args:
+        files (list): Full list of file paths.
+        num_shards (int, optional): Total number of shards. Defaults to 1.
+        shard_index (int, optional): Index of the shard to select. Defaults to 0.
+
+    Returns:
+        list: Files belonging to the selected shard.
+    """
+    assert num_shards > 0 and 0 <= shard_index < num_shards
+    return files[shard_index::num_shards]
+
+
+def read_manifest(manifest_path: str) -> set:
+    """
+    Read the set of already processed files from a manifest.
+
+    Args:
+        manifest_path (str): Path to the manifest file, one processed path per line.
+
+    Returns:
+        set: Processed file paths, empty if the manifest does not exist yet.
+    """
+    if manifest_path is None or not os.path.isfile(manifest_path):
+        return set()
+    with open(manifest_path, "r") as f:
+        return set(line.strip() for line in f if len(line.strip()) > 0)
+
+
+def append_to_manifest(manifest_path: str, filenames: list) -> None:
+    """
+    Record processed files in a manifest.
+
+    Args:
+        manifest_path (str): Path to the manifest file.
+        filenames (list): File paths to record.
+    """
+    if manifest_path is None or len(filenames) == 0:
+        return
+    with open(manifest_path, "a") as f:
+        f.write("".join(str(i) + "\n" for i in filenames))
+        f.flush()
+        os.fsync(f.fileno())
+
+
 class FileLoader:
     """
     Class to load files (images or DICOM) from disk.
     """
 
-    def __init__(self, gpus: str):
+    def __init__(
+        self,
+        gpus: str,
+        base_size: int = 512,
+        defer_normalization: bool = False,
+        use_dicom_window: bool = False,
+        load_orig_data: bool = False,
+    ):
         """
         Initialize the FileLoader.
 
         Args:
             gpus (str): GPU(s) to use for processing.
-        """
-        self.base_size = 512
+            base_size (int, optional): Size inputs are resized to, None keeps the native
+                resolution. Defaults to 512.
+            defer_normalization (bool, optional): Return the decoded single-channel pixels
+                under 'pixels' instead of 'data', to be normalized batch-wise on the
+                target device by prepare_batch. Defaults to False.
+            use_dicom_window (bool, optional): Scale DICOMs with their window center/width
+                and photometric interpretation instead of min-max. Defaults to False.
+            load_orig_data (bool, optional): Include the full-resolution uint8 image under
+                'orig_data'. Otherwise it can be loaded on demand with load_original.
+                Defaults to False.
+        """
+        self.base_size = base_size
+        self.defer_normalization = defer_normalization
+        self.use_dicom_window = use_dicom_window
+        self.load_orig_data = load_orig_data
         self.file_types = {
             "jpg": self.load_image,
             "png": self.load_image,
@@ -171,11 +405,25 @@ class FileLoader:
         # Array to be assumed in range [0,1]
         assert (array.min() >= 0) and (array.max() <= 1)
 
-        array = (array - torch.tensor([0.485, 0.456, 0.406]).view(-1, 1, 1)) / (
-            torch.tensor([0.229, 0.224, 0.225]).view(-1, 1, 1)
-        )
+        mean = torch.tensor([0.485, 0.456, 0.406], device=array.device)
+        std = torch.tensor([0.229, 0.224, 0.225], device=array.device)
+        array = (array - mean.view(-1, 1, 1)) / std.view(-1, 1, 1)
         return array
 
+    def resize(self, array: torch.tensor) -> torch.tensor:
+        """
+        Resize batched image tensor to the base size.
+
+        Args:
+            array (torch.tensor): Input tensor.
+
+        Returns:
+            torch.tensor: Resized tensor, unchanged if base_size is None.
+        """
+        if self.base_size is None:
+            return array
+        return F.interpolate(array, self.base_size)
+
     def load_file(self, file_path: str) -> dict:
         """
         Load file based on its extension.
@@ -196,52 +444,234 @@ class FileLoader:
         """
         Load image from file.
 
+        JPEGs are decoded at the smallest DCT scale (1/2, 1/4 or 1/8) that keeps both
+        sides at least base_size, and grayscale images stay single-channel until they
+        are resized.
+
         Args:
             image_path (str): Path to the image file.
 
         Returns:
             dict: Image data.
         """
-        array = np.array(Image.open(image_path).convert(mode="RGB"))
-        array = np.transpose(array, [2, 0, 1])
-        original_array = np.copy(array)
-        orig_file_size = array.shape[-2:]
-        array = torch.tensor(array).float() / 255
-        array = self.normalize(array)
-        array = self.to_gpu(array)
-        return {
-            "data": F.interpolate(array.unsqueeze(0), self.base_size),
-            "orig_data": original_array,
-            "filename": image_path,
-            "file_size": orig_file_size,
-        }
+        array, orig_file_size = read_image(image_path, self.base_size)
+        if self.defer_normalization:
+            return {
+                "pixels": torch.from_numpy(np.ascontiguousarray(array)),
+                "window": None,
+                "invert": False,
+                "unsigned": False,
+                "filename": image_path,
+                "file_size": orig_file_size,
+            }
+        out_dict = {"filename": image_path, "file_size": orig_file_size}
+        if self.load_orig_data:
+            out_dict["orig_data"] = self.load_original(image_path)
+        array = self.to_gpu(torch.from_numpy(array).float() / 255)
+        array = self.resize(array.unsqueeze(0))[0]
+        out_dict["data"] = self.normalize(array.expand(3, -1, -1)).unsqueeze(0)
+        return out_dict
 
     def load_dicom(self, image_path: str) -> dict:
         """
         Load DICOM image.
 
+        The pixels stay single-channel in their stored integer type until they are
+        scaled, resized and only then broadcast to three channels.
+
         Args:
             image_path (str): Path to the DICOM file.
 
         Returns:
             dict: DICOM image data.
         """
-        image = sitk.ReadImage(image_path)
-        array_view = sitk.GetArrayFromImage(image).astype(np.float32)
-        assert (len(array_view.shape) == 3) and (array_view.shape[0] == 1)
-        orig_file_size = array_view.shape[-2:]
-        tensor = torch.tensor(array_view).float()
-        tensor = (tensor - tensor.min()) / (tensor.max() - tensor.min())
-        tensor = torch.cat([tensor, tensor, tensor], 0)
-        original_array = (tensor.numpy() * 255).astype(np.uint8)
-        array = self.normalize(tensor)
-        array = self.to_gpu(array)
-        return {
-            "data": F.interpolate(array.unsqueeze(0), self.base_size),
-            "orig_data": original_array,
-            "filename": image_path,
-            "file_size": orig_file_size,
-        }
+        dicom = read_dicom(image_path)
+        window = dicom["window"] if self.use_dicom_window else None
+        invert = dicom["invert"] and self.use_dicom_window
+
+        if self.defer_normalization:
+            return {
+                "pixels": dicom["pixels"],
+                "window": window,
+                "invert": invert,
+                "unsigned": dicom["unsigned"],
+                "filename": image_path,
+                "file_size": dicom["file_size"],
+            }
+
+        out_dict = {"filename": image_path, "file_size": dicom["file_size"]}
+        array = pixels_to_float(dicom["pixels"], dicom["unsigned"])
+        scaled = self.scale_pixels(array, window, invert)
+        if self.load_orig_data:
+            original_array = (scaled.numpy() * 255).astype(np.uint8)
+            out_dict["orig_data"] = np.broadcast_to(
+                original_array, (3, *original_array.shape)
+            )
+        array = self.to_gpu(scaled)
+        array = self.resize(array[None, None])[0]
+        out_dict["data"] = self.normalize(array.expand(3, -1, -1)).unsqueeze(0)
+        return out_dict
+
+    def load_original(self, file_path: str) -> np.array:
+        """
+        Load the full-resolution image of a file, as used for visualization.
+
+        Args:
+            file_path (str): Path to the file.
+
+        Returns:
+            np.array: uint8 image in shape [3, height, width].
+        """
+        if file_path.split(".")[-1].lower() != "dcm":
+            array = np.array(Image.open(file_path).convert(mode="RGB"))
+            return np.transpose(array, [2, 0, 1])
+
+        dicom = read_dicom(file_path)
+        window = dicom["window"] if self.use_dicom_window else None
+        invert = dicom["invert"] and self.use_dicom_window
+        array = pixels_to_float(dicom["pixels"], dicom["unsigned"])
+        array = (self.scale_pixels(array, window, invert).numpy() * 255).astype(np.uint8)
+        return np.broadcast_to(array, (3, *array.shape))
+
+    def scale_pixels(
+        self, array: torch.tensor, window: tuple = None, invert: bool = False
+    ) -> torch.tensor:
+        """
+        Scale single-channel pixel values to [0,1].
+
+        Args:
+            array (torch.tensor): Float pixel values.
+            window (tuple, optional): DICOM window (center, width), min-max scaling if None.
+            invert (bool, optional): Invert the scaled values (MONOCHROME1).
+
+        Returns:
+            torch.tensor: Scaled tensor.
+        """
+        if window is not None:
+            low = window[0] - window[1] / 2
+            array = ((array - low) / window[1]).clamp(0, 1)
+        else:
+            array = (array - array.min()) / (array.max() - array.min())
+        if invert:
+            array = 1 - array
+        return array
+
+    def prepare_batch(self, batch: dict, device) -> dict:
+        """
+        Normalize deferred pixels of a batch on the target device.
+
+        Args:
+            batch (dict): Batch of a loader with defer_normalization.
+            device: Device to normalize on.
+
+        Returns:
+            dict: Batch with the model input under 'data'.
+        """
+        if "pixels" not in batch.keys():
+            batch["data"] = batch["data"].to(device, non_blocking=True)
+            return batch
+
+        data = []
+        for pixels, window, invert, unsigned in zip(
+            batch.pop("pixels"), batch["window"], batch["invert"], batch["unsigned"]
+        ):
+            array = pixels_to_float(pixels.to(device, non_blocking=True), unsigned)
+            if array.ndim == 3:
+                # Images are stored as uint8 [1, H, W] or [3, H, W]
+                array = array / 255
+            else:
+                array = self.scale_pixels(array, window, invert)[None]
+            array = self.resize(array[None])[0]
+            data += [self.normalize(array.expand(3, -1, -1)).unsqueeze(0)]
+        batch["data"] = torch.cat(data, 0)
+        return batch
+
+
+def read_image(image_path: str, min_size: int = None) -> tuple:
+    """
+    Decode an image file, directly at reduced resolution for JPEGs.
+
+    Args:
+        image_path (str): Path to the image file.
+        min_size (int, optional): Smallest side length needed, full resolution if None.
+
+    Returns:
+        tuple: uint8 array in shape [1, H, W] for grayscale or [3, H, W] images, and
+            the (height, width) of the image at full resolution.
+    """
+    image = Image.open(image_path)
+    orig_file_size = (image.size[1], image.size[0])
+    if min_size is not None:
+        # libjpeg downscales in the DCT domain, other formats ignore the draft
+        image.draft(None, (min_size, min_size))
+    if image.mode == "L":
+        return np.array(image)[None], orig_file_size
+    array = np.array(image.convert(mode="RGB"))
+    return np.ascontiguousarray(np.transpose(array, [2, 0, 1])), orig_file_size
+
+
+def read_dicom(image_path: str) -> dict:
+    """
+    Decode the pixels and display tags of a single-frame DICOM.
+
+    Pixels are kept in their stored type. torch has no uint16, so uint16 pixels are
+    reinterpreted as int16 without copying and flagged as unsigned.
+
+    Args:
+        image_path (str): Path to the DICOM file.
+
+    Returns:
+        dict: Pixels as a [H, W] tensor, 'unsigned' flag, window (center, width) or
+            None, 'invert' for MONOCHROME1 images and the file size.
+    """
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(image_path)
+    image = reader.Execute()
+
+    def get_tag(key):
+        if not reader.HasMetaDataKey(key):
+            return None
+        # Multi-valued tags are backslash separated, the first value is the default
+        return reader.GetMetaData(key).split("\\")[0].strip()
+
+    array = sitk.GetArrayFromImage(image)
+    assert (len(array.shape) == 3) and (array.shape[0] == 1)
+    array = array[0]
+
+    unsigned = array.dtype == np.uint16
+    if unsigned:
+        array = array.view(np.int16)
+    elif array.dtype not in [np.uint8, np.int16, np.int32]:
+        array = array.astype(np.float32)
+
+    window = None
+    center, width = get_tag("0028|1050"), get_tag("0028|1051")
+    if center and width and float(width) > 0:
+        window = (float(center), float(width))
+
+    return {
+        "pixels": torch.from_numpy(np.ascontiguousarray(array)),
+        "unsigned": unsigned,
+        "window": window,
+        "invert": get_tag("0028|0004") == "MONOCHROME1",
+        "file_size": array.shape[-2:],
+    }
+
+
+def pixels_to_float(pixels: torch.tensor, unsigned: bool) -> torch.tensor:
+    """
+    Convert decoded pixels to float32.
+
+    Args:
+        pixels (torch.tensor): Pixels as returned by read_dicom or load_image.
+        unsigned (bool): Whether int16 pixels hold reinterpreted uint16 values.
+
+    Returns:
+        torch.tensor: Float pixel values.
+    """
+    if unsigned:
+        pixels = pixels.int() & 0xFFFF
+    return pixels.float()
 
 
 class FileSaver:
@@ -105,3 +105,24 @@ def set_gpus(user_input: str) -> Union[str, List[str]]:
         return mapped_devices  # Return list of devices if multiple
 
     return "cpu"  # Default to CPU if input is invalid or not understood
+
+
+def resize_mask(mask: torch.Tensor, size) -> torch.Tensor:
+    """
+    Nearest-neighbour resize of a boolean mask, indexing it instead of interpolating a float copy.
+
+    Args:
+        mask (torch.Tensor): Boolean mask of shape [C, H, W].
+        size: Target (height, width).
+
+    Returns:
+        torch.Tensor: Boolean mask of shape [C, *size], equal to F.interpolate(mode="nearest").
+    """
+    size = tuple(int(s) for s in size)
+    if tuple(mask.shape[-2:]) == size:
+        return mask
+    index = [
+        (torch.arange(out, device=mask.device) * (inp / out)).long().clamp(max=inp - 1)
+        for inp, out in zip(mask.shape[-2:], size)
+    ]
+    return mask[:, index[0]][:, :, index[1]]
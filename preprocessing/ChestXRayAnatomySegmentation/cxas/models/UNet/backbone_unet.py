@@ -1,3 +1,4 @@
+import contextlib
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -22,6 +23,17 @@ class BackboneUNet(nn.Module):
         self.dropout = nn.Dropout(p=0)
         self.threshold = 0.5
 
+        # Inference options, set through cxas.models.optimize_for_cpu
+        self.memory_format = torch.contiguous_format
+        self.autocast_dtype = None
+        self.compiled_forward = None
+        self.traced_input_size = None
+
+        # Tiled inference options, set through cxas.models.enable_tiled_inference
+        self.tile_size = None
+        self.tile_overlap = 0.25
+        self.tile_batch_size = 4
+
     def get_results(self, forward_dict, orig_dict):
         """
         Combines forward results with original input dictionary.
@@ -49,13 +61,111 @@ class BackboneUNet(nn.Module):
             x (tensor): Input tensor.
 
         Returns:
-            dict: Output dictionary with segmentation predictions.
+            dict: Output dictionary with segmentation predictions, and with feats and
+            logits unless tiled inference is enabled.
         """
         img = x["data"]
-        forward_dict = self._forward(img)
+
+        if self.tile_size is not None:
+            return {**x, "segmentation_preds": self._tiled_forward(img)}
+
+        forward_dict = self._run_forward(img)
         out_dict = self.get_results(forward_dict, x)
         return out_dict
 
+    def _run_forward(self, x):
+        """
+        Runs the internal forward pass with the configured inference options.
+
+        Args:
+            x (tensor): Input tensor.
+
+        Returns:
+            dict: Dictionary containing float32 features and logits.
+        """
+        x = x.contiguous(memory_format=self.memory_format)
+
+        # A trace is specialized to its input size and already contains the autocast casts
+        traced = self.traced_input_size is not None
+        use_compiled = self.compiled_forward is not None and (
+            not traced or tuple(x.shape[2:]) == self.traced_input_size
+        )
+        forward = self.compiled_forward if use_compiled else self._forward
+
+        if self.autocast_dtype is not None and not (traced and use_compiled):
+            autocast = torch.autocast(
+                device_type=x.device.type, dtype=self.autocast_dtype
+            )
+        else:
+            autocast = contextlib.nullcontext()
+
+        with autocast:
+            forward_dict = forward(x)
+        return {k: v.float() for k, v in forward_dict.items()}
+
+    def _tiled_forward(self, x):
+        """
+        Sliding-window forward pass over overlapping tiles of size tile_size.
+
+        Logits of overlapping tiles are blended with a Gaussian window. Tiles are
+        processed one row at a time and rows are thresholded as soon as no later
+        tile covers them, so only a buffer of tile_size rows of logits is kept.
+
+        Args:
+            x (tensor): Input tensor of any spatial size.
+
+        Returns:
+            tensor: Thresholded multi-label segmentation at the input size.
+        """
+        tile = self.tile_size
+        stride = max(int(tile * (1 - self.tile_overlap)), 1)
+        batch_size, _, height, width = x.shape
+
+        # Pad inputs smaller than a tile, padding is cropped from the result
+        x = F.pad(x, (0, max(tile - width, 0), 0, max(tile - height, 0)))
+        padded_height, padded_width = x.shape[2:]
+        rows = get_tile_starts(padded_height, tile, stride)
+        cols = get_tile_starts(padded_width, tile, stride)
+
+        window = get_tile_window(tile, x.device)
+        preds, logits, weights = None, None, None
+
+        for i, y in enumerate(rows):
+            tiles = [x[:, :, y : y + tile, c : c + tile] for c in cols]
+            for j in range(0, len(tiles), self.tile_batch_size):
+                chunk = tiles[j : j + self.tile_batch_size]
+                chunk_logits = self._run_forward(torch.cat(chunk, 0))["logits"]
+                chunk_logits = chunk_logits.view(
+                    len(chunk), batch_size, *chunk_logits.shape[1:]
+                )
+                if logits is None:
+                    classes = chunk_logits.shape[2]
+                    logits = x.new_zeros(batch_size, classes, tile, padded_width)
+                    weights = x.new_zeros(tile, padded_width)
+                    preds = torch.zeros(
+                        batch_size,
+                        classes,
+                        padded_height,
+                        padded_width,
+                        dtype=torch.bool,
+                        device=x.device,
+                    )
+                for k, c in enumerate(cols[j : j + self.tile_batch_size]):
+                    logits[..., c : c + tile] += chunk_logits[k] * window
+                    weights[:, c : c + tile] += window
+
+            # Rows above the next tile row are not covered by any later tile
+            done = (rows[i + 1] if i + 1 < len(rows) else padded_height) - y
+            preds[:, :, y : y + done] = (
+                logits[:, :, :done] / weights[:done]
+            ).sigmoid() > self.threshold
+            logits = torch.cat(
+                [logits[:, :, done:], torch.zeros_like(logits[:, :, :done])], 2
+            )
+            weights = torch.cat([weights[done:], torch.zeros_like(weights[:done])], 0)
+
+        return preds[:, :, :height, :width]
+
     def _forward(self, x):
         """
         Internal forward pass of the BackboneUNet model.
@@ -85,6 +195,67 @@ class BackboneUNet(nn.Module):
         return {"feats": up4, "logits": logits}
 
 
+class ForwardWrapper(nn.Module):
+    """
+    Exposes BackboneUNet._forward as the forward of a module, so it can be traced.
+    """
+
+    def __init__(self, model: BackboneUNet):
+        """
+        Initializes the ForwardWrapper.
+
+        Args:
+            model (BackboneUNet): Model whose internal forward pass is wrapped.
+        """
+        super(ForwardWrapper, self).__init__()
+        self.model = model
+
+    def forward(self, x):
+        """
+        Forward pass of the wrapped model.
+
+        Args:
+            x (tensor): Input tensor.
+
+        Returns:
+            dict: Dictionary containing features and logits.
+        """
+        return self.model._forward(x)
+
+
+def get_tile_starts(length, tile, stride):
+    """
+    Computes the start offsets of tiles covering a dimension.
+
+    Args:
+        length (int): Size of the dimension, at least tile.
+        tile (int): Tile size.
+        stride (int): Distance between tile starts.
+
+    Returns:
+        list: Start offsets, the last tile ends exactly at length.
+    """
+    starts = list(range(0, length - tile, stride))
+    return starts + [length - tile]
+
+
+def get_tile_window(tile, device):
+    """
+    Computes the Gaussian blending window of a tile.
+
+    Args:
+        tile (int): Tile size.
+        device (torch.device): Device of the window.
+
+    Returns:
+        tensor: Window of shape [tile, tile] with a strictly positive minimum.
+    """
+    coords = torch.arange(tile, device=device).float() - (tile - 1) / 2
+    gauss = torch.exp(-(coords**2) / (2 * (tile / 8) ** 2))
+    window = gauss[:, None] * gauss[None, :]
+    return (window / window.max()).clamp(min=1e-3)
+
+
 def get_unet_head(network_name, classes, batch_size=1):
     """
     Retrieves the UNet head based on the network name.
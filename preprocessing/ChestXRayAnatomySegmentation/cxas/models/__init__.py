@@ -1,3 +1,4 @@
+import contextlib
 import gdown, os, torch
 from ..label_mapper import id2label_dict
 
@@ -103,6 +104,114 @@ def load_weights(model, model_name: str, map_location: str = "cuda:0"):
     return model
 
 
+def optimize_for_cpu(
+    model,
+    channels_last: bool = True,
+    bf16: bool = False,
+    jit: str = None,
+    num_threads: int = None,
+    input_size: int = 512,
+):
+    """
+    Function to configure a loaded model for fast inference on CPU.
+
+    Dynamic int8 quantization is not offered, as it only covers nn.Linear layers
+    and the UNet consists of convolutions and normalization layers only.
+
+    Args:
+        model (torch.nn.Module): Model returned by get_model, loaded on CPU.
+        channels_last (bool): Run convolutions in channels-last (NHWC) memory format.
+        bf16 (bool): Run the forward pass under bfloat16 autocast.
+        jit (str): Graph export of the forward pass, one of [None, 'trace', 'compile'].
+                   'trace' freezes a TorchScript trace for inputs of shape input_size,
+                   'compile' uses torch.compile.
+        num_threads (int): Number of intra-op threads, defaults to the torch default.
+        input_size (int): Spatial input size used to trace the model, inputs of other
+                          sizes run the eager forward pass.
+
+    Returns:
+        torch.nn.Module: The configured model.
+    """
+    assert jit in [None, "trace", "compile"], f"unknown jit mode: {jit}"
+    assert not isinstance(model, torch.nn.DataParallel)
+
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+    model.eval()
+    if channels_last:
+        model.to(memory_format=torch.channels_last)
+        model.memory_format = torch.channels_last
+    if bf16:
+        model.autocast_dtype = torch.bfloat16
+
+    if jit == "trace":
+        from .UNet.backbone_unet import ForwardWrapper
+
+        example = torch.randn(1, 3, input_size, input_size).contiguous(
+            memory_format=model.memory_format
+        )
+        # Record the autocast casts in the trace, the traced graph then runs without autocast
+        with torch.no_grad(), jit_autocast_mode(False), torch.autocast(
+            device_type="cpu", dtype=torch.bfloat16, enabled=bf16
+        ):
+            traced = torch.jit.trace(ForwardWrapper(model).eval(), example, strict=False)
+            traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+        with torch.no_grad():
+            # Run the profiling passes of the executor once before the first real batch
+            traced(example)
+            traced(example)
+        model.compiled_forward = traced
+        model.traced_input_size = (input_size, input_size)
+    elif jit == "compile":
+        model.compiled_forward = torch.compile(model._forward)
+
+    return model
+
+
+@contextlib.contextmanager
+def jit_autocast_mode(enabled: bool):
+    """
+    Context manager setting the process-wide TorchScript autocast pass, restoring the previous mode on exit.
+
+    Args:
+        enabled (bool): Whether the JIT applies autocast to scripted and traced graphs.
+    """
+    previous = torch._C._jit_set_autocast_mode(enabled)
+    try:
+        yield
+    finally:
+        torch._C._jit_set_autocast_mode(previous)
+
+
+def enable_tiled_inference(
+    model, tile_size: int = 512, overlap: float = 0.25, tile_batch_size: int = 4
+):
+    """
+    Function to make a model segment inputs in overlapping tiles.
+
+    Together with a FileLoader of larger base_size, this segments images above the
+    512px training resolution while only tile_batch_size tiles and tile_size rows of
+    float logits are held in memory, next to the boolean masks at the input size.
+    The model then returns segmentation_preds without feats and logits.
+
+    Args:
+        model (torch.nn.Module): Model returned by get_model.
+        tile_size (int): Spatial size of the tiles, a multiple of 32.
+        overlap (float): Fraction of a tile overlapping with its neighbours.
+        tile_batch_size (int): Number of tiles per forward pass.
+
+    Returns:
+        torch.nn.Module: The configured model.
+    """
+    assert tile_size % 32 == 0 and 0 <= overlap < 1
+    inner = model.module if isinstance(model, torch.nn.DataParallel) else model
+    inner.tile_size = tile_size
+    inner.tile_overlap = overlap
+    inner.tile_batch_size = tile_batch_size
+    return model
+
+
 # Dictionary containing model getter functions
 model_getter = {
     "UNet": get_unet,
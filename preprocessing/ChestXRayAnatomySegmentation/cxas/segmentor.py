@@ -7,13 +7,20 @@ import numpy as np
 from tqdm import tqdm
 
 from .file_io import FileLoader, FileSaver, get_folder_loader
-from .models import get_model
+from .models import get_model, optimize_for_cpu, enable_tiled_inference
 from .extraction import Extractor
-from .helper import set_gpus, get_available_devices, find_max_overlap
+from .helper import set_gpus, get_available_devices, find_max_overlap, resize_mask
 
 
 class CXAS(nn.Module):
-    def __init__(self, model_name: str = "UNet_ResNet50_default", gpus: str = ""):
+    def __init__(
+        self,
+        model_name: str = "UNet_ResNet50_default",
+        gpus: str = "",
+        cpu_options: dict = None,
+        tile_options: dict = None,
+        use_dicom_window: bool = False,
+    ):
         """
         Create Chest X-Ray anatomy segmentation model
 
@@ -23,12 +30,29 @@ class CXAS(nn.Module):
 
             gpus: on which gpu to perform inference on
 
+            cpu_options: if given, keyword arguments of cxas.models.optimize_for_cpu to configure CPU inference, e.g. {"bf16": True, "jit": "trace"}
+
+            tile_options: if given, segment inputs resized to tile_options["base_size"] (None for native resolution) in overlapping tiles, the remaining keys are passed to cxas.models.enable_tiled_inference; the model then returns segmentation_preds without feats and logits
+
+            use_dicom_window: scale DICOMs with their window center/width tags instead of min-max
+
         """
         super(CXAS, self).__init__()
 
         self.gpus = set_gpus(gpus)
         self.model = get_model(model_name, gpus)
-        self.fileloader = FileLoader(gpus)
+        if cpu_options is not None:
+            assert "cpu" in gpus, "cpu_options require gpus='cpu'"
+            self.model = optimize_for_cpu(self.model, **cpu_options)
+        self.base_size = 512
+        if tile_options is not None:
+            tile_options = dict(tile_options)
+            self.base_size = tile_options.pop("base_size", None)
+            self.model = enable_tiled_inference(self.model, **tile_options)
+        self.use_dicom_window = use_dicom_window
+        self.fileloader = FileLoader(
+            gpus, self.base_size, use_dicom_window=use_dicom_window
+        )
         self.filesaver = FileSaver()
         self.extractor = Extractor()
         self.eval()
@@ -101,6 +125,9 @@ class CXAS(nn.Module):
             input_directory_name,
             self.gpus,
             batch_size,
+            base_size=self.base_size,
+            defer_normalization=True,
+            use_dicom_window=self.use_dicom_window,
         )
 
         if storage_type == "json":
@@ -124,10 +151,7 @@ class CXAS(nn.Module):
             base_ann_id = 1
 
         for file_dict in tqdm(dataloader):
-            if (type(self.gpus) is list) and len(self.gpus) > 0:
-                file_dict["data"] = file_dict["data"].to("{}".format(self.gpus[0]))
-            else:
-                file_dict["data"] = file_dict["data"].to(self.gpus)
+            file_dict = self.fileloader.prepare_batch(file_dict, self.get_device())
 
             with torch.no_grad():
                 predictions = self.model(file_dict)
@@ -158,6 +182,14 @@ class CXAS(nn.Module):
             with open(out_path, "w") as outfile:
                 json.dump(coco_format, outfile)
 
+    def get_device(self):
+        """
+        Device model inputs are moved to
+        """
+        if (type(self.gpus) is list) and len(self.gpus) > 0:
+            return "{}".format(self.gpus[0])
+        return self.gpus
+
     def store_prediction(
         self, predictions: dict, output_directory: str, storage_type: str
     ) -> None:
@@ -194,10 +226,7 @@ class CXAS(nn.Module):
             segmentation: model output dictionary containing [feats: network features , logits: unnormalized network logit scores, data: input data, segmentation_preds: thresholded multi-label segmentations]
             file_size: desired path of output directory
         """
-        pred = segmentation.float()
-        pred = F.interpolate(pred.unsqueeze(0), file_size, mode="nearest")
-        pred = pred[0].bool().to("cpu").numpy()
-        return pred
+        return resize_mask(segmentation.bool(), file_size).to("cpu").numpy()
 
     def extract_features_for_file(
         self,
@@ -311,6 +340,7 @@ class CXAS(nn.Module):
             input_directory_name,
             self.gpus,
             batch_size,
+            base_size=self.base_size,
         )
 
         if (storage_type == "json") and store_pred:
@@ -4,16 +4,31 @@ import torch.nn.functional as F
 import os
 import pandas as pd
 import numpy as np
+import time
 from tqdm import tqdm
 
-from .file_io import FileLoader, FileSaver, get_folder_loader
-from .models import get_model
+from .file_io import (
+    FileLoader,
+    FileSaver,
+    get_folder_loader,
+    get_file_list_loader,
+    read_manifest,
+    append_to_manifest,
+)
+from .models import get_model, optimize_for_cpu, enable_tiled_inference
 from .extraction import Extractor
-from .helper import set_gpus, get_available_devices, find_max_overlap
+from .helper import set_gpus, get_available_devices, find_max_overlap, resize_mask
 
 
 class CXAS(nn.Module):
-    def __init__(self, model_name: str = "UNet_ResNet50_default", gpus: str = ""):
+    def __init__(
+        self,
+        model_name: str = "UNet_ResNet50_default",
+        gpus: str = "",
+        cpu_options: dict = None,
+        tile_options: dict = None,
+        use_dicom_window: bool = False,
+    ):
         """
         Create Chest X-Ray anatomy segmentation model
 
@@ -23,12 +38,29 @@ class CXAS(nn.Module):
 
             gpus: on which gpu to perform inference on
 
+            cpu_options: if given, keyword arguments of cxas.models.optimize_for_cpu to configure CPU inference, e.g. {"bf16": True, "jit": "trace"}
+
+            tile_options: if given, segment inputs resized to tile_options["base_size"] (None for native resolution) in overlapping tiles, the remaining keys are passed to cxas.models.enable_tiled_inference; the model then returns segmentation_preds without feats and logits
+
+            use_dicom_window: scale DICOMs with their window center/width tags instead of min-max
+
         """
         super(CXAS, self).__init__()
 
         self.gpus = set_gpus(gpus)
         self.model = get_model(model_name, gpus)
-        self.fileloader = FileLoader(gpus)
+        if cpu_options is not None:
+            assert "cpu" in gpus, "cpu_options require gpus='cpu'"
+            self.model = optimize_for_cpu(self.model, **cpu_options)
+        self.base_size = 512
+        if tile_options is not None:
+            tile_options = dict(tile_options)
+            self.base_size = tile_options.pop("base_size", None)
+            self.model = enable_tiled_inference(self.model, **tile_options)
+        self.use_dicom_window = use_dicom_window
+        self.fileloader = FileLoader(
+            gpus, self.base_size, use_dicom_window=use_dicom_window
+        )
         self.filesaver = FileSaver()
         self.extractor = Extractor()
         self.eval()
@@ -98,7 +130,7 @@ class CXAS(nn.Module):
         """
         assert os.path.isfile(filename)
         
-        output_file_path = os.path.join(os.path.basename(os.path.dirname(filename)),f'{filename[:-4]}_lung.jpg')
+        output_file_path = self.get_mask_file_path(filename)
 
         file_dict = self.fileloader.load_file(filename)
         file_dict["filename"] = [file_dict["filename"]]
@@ -110,6 +142,105 @@ class CXAS(nn.Module):
             self.store_prediction(filename, predictions, output_file_path, storage_type)
         return predictions
 
+    def get_mask_file_path(self, filename: str) -> str:
+        """
+        Path the masked image of a file is stored at by generate_mask_file
+
+        Parameters
+        ----------
+            filename: path of the input file
+        """
+        return os.path.join(
+            os.path.basename(os.path.dirname(filename)), f"{filename[:-4]}_lung.jpg"
+        )
+
+    def process_file_list(
+        self,
+        files: list,
+        storage_type: str = "jpg",
+        batch_size: int = 8,
+        num_workers: int = 4,
+        prefetch_factor: int = 2,
+        basepath: str = None,
+        manifest_path: str = None,
+        skip_existing: bool = True,
+    ) -> dict:
+        """
+        Create masked images for a list of files in batches, as generate_mask_file does for a single file.
+        Processed files are appended to a manifest after every batch, so an interrupted run can be resumed.
+
+        Parameters
+        ----------
+            files: paths of files to process, currently supported types [.dcm, .jpg, .png]
+            storage_type: desired type to store segmentation prediction as, currently supported types [dicom-seg, jpg, png, npy, npz, json]
+            batch_size: batch size used for the forward passes of the model
+            num_workers: number of dataloader worker processes decoding files ahead of the model
+            prefetch_factor: number of batches prefetched by each worker
+            basepath: directory the paths in files are relative to
+            manifest_path: file recording processed inputs, files listed in it are skipped
+            skip_existing: whether to also skip files whose output already exists
+
+        Returns
+        -------
+            stats: dictionary containing [processed, skipped, failed, seconds, images_per_second]
+        """
+        done = read_manifest(manifest_path)
+        todo = []
+        for f in files:
+            path = os.path.join(basepath, f) if basepath is not None else f
+            if path in done:
+                continue
+            if skip_existing and os.path.isfile(self.get_mask_file_path(path)):
+                continue
+            todo += [path]
+        stats = {"processed": 0, "skipped": len(files) - len(todo), "failed": 0}
+
+        dataloader = get_file_list_loader(
+            todo,
+            "cpu" if self.gpus == "cpu" else "",
+            batch_size,
+            num_workers=num_workers,
+            prefetch_factor=prefetch_factor,
+            base_size=self.base_size,
+            defer_normalization=True,
+            use_dicom_window=self.use_dicom_window,
+        )
+
+        start = time.time()
+        progress = tqdm(dataloader)
+        for file_dict in progress:
+            stats["failed"] += len(file_dict["failed"])
+            for f in file_dict["failed"]:
+                tqdm.write("Could not read file: {}".format(f))
+            if "pixels" not in file_dict.keys():
+                continue
+            file_dict = self.fileloader.prepare_batch(file_dict, self.get_device())
+
+            with torch.no_grad():
+                predictions = self.model(file_dict)
+
+            for i in range(len(predictions["filename"])):
+                pred = self.resize_to_numpy(
+                    segmentation=predictions["segmentation_preds"][i],
+                    file_size=predictions["file_size"][i],
+                )
+                self.filesaver.save_prediction(
+                    predictions["filename"][i],
+                    pred,
+                    self.get_mask_file_path(predictions["filename"][i]),
+                    storage_type,
+                )
+            append_to_manifest(manifest_path, predictions["filename"])
+
+            stats["processed"] += len(predictions["filename"])
+            progress.set_postfix(
+                img_per_s="{:.2f}".format(stats["processed"] / (time.time() - start))
+            )
+
+        stats["seconds"] = time.time() - start
+        stats["images_per_second"] = stats["processed"] / max(stats["seconds"], 1e-6)
+        return stats
+
 
     def process_folder(
         self,
@@ -140,6 +271,9 @@ class CXAS(nn.Module):
             input_directory_name,
             self.gpus,
             batch_size,
+            base_size=self.base_size,
+            defer_normalization=True,
+            use_dicom_window=self.use_dicom_window,
         )
 
         if storage_type == "json":
@@ -163,10 +297,7 @@ class CXAS(nn.Module):
             base_ann_id = 1
 
         for file_dict in tqdm(dataloader):
-            if (type(self.gpus) is list) and len(self.gpus) > 0:
-                file_dict["data"] = file_dict["data"].to("{}".format(self.gpus[0]))
-            else:
-                file_dict["data"] = file_dict["data"].to(self.gpus)
+            file_dict = self.fileloader.prepare_batch(file_dict, self.get_device())
 
             with torch.no_grad():
                 predictions = self.model(file_dict)
@@ -197,6 +328,14 @@ class CXAS(nn.Module):
             with open(out_path, "w") as outfile:
                 json.dump(coco_format, outfile)
 
+    def get_device(self):
+        """
+        Device model inputs are moved to
+        """
+        if (type(self.gpus) is list) and len(self.gpus) > 0:
+            return "{}".format(self.gpus[0])
+        return self.gpus
+
     def store_prediction(
         self, filename : str ,  predictions: dict, output_file_path : str, storage_type: str
     ) -> None:
@@ -234,10 +373,7 @@ class CXAS(nn.Module):
             segmentation: model output dictionary containing [feats: network features , logits: unnormalized network logit scores, data: input data, segmentation_preds: thresholded multi-label segmentations]
             file_size: desired path of output directory
         """
-        pred = segmentation.float()
-        pred = F.interpolate(pred.unsqueeze(0), file_size, mode="nearest")
-        pred = pred[0].bool().to("cpu").numpy()
-        return pred
+        return resize_mask(segmentation.bool(), file_size).to("cpu").numpy()
 
     def extract_features_for_file(
         self,
@@ -351,6 +487,7 @@ class CXAS(nn.Module):
             input_directory_name,
             self.gpus,
             batch_size,
+            base_size=self.base_size,
         )
 
         if (storage_type == "json") and store_pred:
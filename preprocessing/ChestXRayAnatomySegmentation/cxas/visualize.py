@@ -30,7 +30,7 @@ def get_img(path: str) -> np.array:
     """
     assert os.path.isfile(path)
     loader = FileLoader("")
-    return loader.load_file(path)["orig_data"]
+    return loader.load_original(path)
 
 
 def get_label(path: str) -> np.array:
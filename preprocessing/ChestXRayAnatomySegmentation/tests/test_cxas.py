@@ -4,7 +4,20 @@ import torch
 import numpy as np
 import os
 import shutil
+import tempfile
+from PIL import Image
 from cxas import CXAS
+from cxas.file_io import (
+    FileLoader,
+    FileListDataset,
+    shard_file_list,
+    read_manifest,
+    append_to_manifest,
+    pixels_to_float,
+    read_image,
+)
+from cxas.models.UNet.backbone_unet import get_tile_starts, get_tile_window
+from cxas.helper import resize_mask
 
 
 class TestCXAS(unittest.TestCase):
@@ -120,5 +133,99 @@ class TestCXAS(unittest.TestCase):
         shutil.rmtree(out_path)  # Clean up
 
 
+class TestFileList(unittest.TestCase):
+
+    def test_shard_file_list(self):
+        """Test that shards partition the file list."""
+        files = ["{}.jpg".format(i) for i in range(10)]
+        shards = [shard_file_list(files, 3, i) for i in range(3)]
+        self.assertEqual(sorted(sum(shards, [])), sorted(files))
+        self.assertEqual(shards[1], ["1.jpg", "4.jpg", "7.jpg"])
+
+    def test_manifest(self):
+        """Test that recorded files are read back from the manifest."""
+        with tempfile.TemporaryDirectory() as tmp:
+            manifest = os.path.join(tmp, "files.done")
+            self.assertEqual(read_manifest(manifest), set())
+            append_to_manifest(manifest, ["a.jpg", "b.jpg"])
+            append_to_manifest(manifest, ["c.jpg"])
+            self.assertEqual(read_manifest(manifest), {"a.jpg", "b.jpg", "c.jpg"})
+
+    def test_unreadable_files(self):
+        """Test that unreadable files are reported as failed instead of raising."""
+        with tempfile.TemporaryDirectory() as tmp:
+            Image.fromarray(np.zeros((64, 64), dtype=np.uint8)).save(os.path.join(tmp, "ok.png"))
+            with open(os.path.join(tmp, "corrupt.jpg"), "wb") as f:
+                f.write(b"not an image")
+            dataset = FileListDataset(
+                ["ok.png", "corrupt.jpg", "missing.png"], basepath=tmp, defer_normalization=True
+            )
+            batch = dataset.collate_fn([dataset[i] for i in range(len(dataset))])
+            self.assertEqual(batch["filename"], [os.path.join(tmp, "ok.png")])
+            self.assertEqual(
+                batch["failed"],
+                [os.path.join(tmp, "corrupt.jpg"), os.path.join(tmp, "missing.png")],
+            )
+
+
+class TestPixelScaling(unittest.TestCase):
+
+    def test_unsigned_pixels(self):
+        """Test that uint16 pixels carried as int16 are restored."""
+        pixels = np.array([[0, 4095, 40000, 65535]], dtype=np.uint16)
+        restored = pixels_to_float(torch.from_numpy(pixels.view(np.int16)), True)
+        self.assertTrue(torch.equal(restored, torch.tensor(pixels.astype(np.float32))))
+
+    def test_window(self):
+        """Test window/level scaling and MONOCHROME1 inversion."""
+        loader = FileLoader("cpu")
+        pixels = torch.tensor([[0.0, 100.0, 200.0, 300.0]])
+        scaled = loader.scale_pixels(pixels, window=(200.0, 200.0))
+        self.assertTrue(torch.allclose(scaled, torch.tensor([[0.0, 0.0, 0.5, 1.0]])))
+        inverted = loader.scale_pixels(pixels, invert=True)
+        self.assertTrue(torch.allclose(inverted, 1 - pixels / 300))
+
+
+class TestReadImage(unittest.TestCase):
+
+    def test_draft_decoding(self):
+        """Test that JPEGs decode reduced but not below the requested size."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "xray.jpg")
+            Image.fromarray(np.random.randint(0, 255, (1800, 2400), dtype=np.uint8)).save(path)
+            array, file_size = read_image(path, 512)
+            self.assertEqual(file_size, (1800, 2400))
+            self.assertEqual(array.shape[0], 1)
+            self.assertTrue(512 <= array.shape[1] < 1800)
+            array, _ = read_image(path)
+            self.assertEqual(array.shape, (1, 1800, 2400))
+
+
+class TestTiling(unittest.TestCase):
+
+    def test_tile_starts(self):
+        """Test that tiles cover the whole dimension."""
+        self.assertEqual(get_tile_starts(512, 512, 384), [0])
+        self.assertEqual(get_tile_starts(1024, 512, 384), [0, 384, 512])
+
+    def test_tile_window(self):
+        """Test that the blending window is positive and peaks at the center."""
+        window = get_tile_window(64, "cpu")
+        self.assertEqual(window.shape, torch.Size([64, 64]))
+        self.assertGreater(window.min().item(), 0)
+        self.assertEqual(window.max().item(), window[31:33, 31:33].max().item())
+
+    def test_resize_mask(self):
+        """Test that masks are resized like nearest interpolation, without a float copy."""
+        mask = torch.rand(3, 37, 50) > 0.5
+        for size in [(37, 50), (100, 77), (16, 20)]:
+            expected = torch.nn.functional.interpolate(
+                mask.float()[None], size, mode="nearest"
+            )[0].bool()
+            resized = resize_mask(mask, size)
+            self.assertEqual(resized.dtype, torch.bool)
+            self.assertTrue(torch.equal(resized, expected))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,56 @@
+import argparse
+import time
+from types import SimpleNamespace
+
+import torch
+
+from tinyllava.model.connector.mof_mlp import MoFMLP
+
+
+def legacy_forward(module, x):
+    # MoFMLP.forward before the interleaving was done with torch.stack
+    image_features_clip = module.clip(x[0])
+    image_features_dinov2 = module.dinov2(x[1])
+    bs = image_features_clip.size(0)
+    total_len = image_features_clip.size(1) + image_features_dinov2.size(1)
+    dim = image_features_clip.size(-1)
+    merged_features = torch.empty(bs, total_len, dim).to(device=x[0].device, dtype=x[0].dtype)
+    merged_features[:, 0::2] = image_features_clip
+    merged_features[:, 1::2] = image_features_dinov2
+    return merged_features
+
+
+def benchmark(fn, iterations, device):
+    for _ in range(3):
+        fn()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start = time.time()
+    for _ in range(iterations):
+        fn()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    return (time.time() - start) / iterations
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--device", type=str, default="cuda")
+parser.add_argument("--dtype", type=str, default="float16", choices=["float16", "bfloat16", "float32"])
+parser.add_argument("--batch-size", type=int, default=8)
+parser.add_argument("--num-tokens", type=int, default=576)
+parser.add_argument("--vision-hidden-size", type=int, default=1024)
+parser.add_argument("--hidden-size", type=int, default=2560)
+parser.add_argument("--iterations", type=int, default=50)
+args = parser.parse_args()
+
+device = torch.device(args.device)
+dtype = getattr(torch, args.dtype)
+config = SimpleNamespace(vision_hidden_size=args.vision_hidden_size, hidden_size=args.hidden_size)
+module = MoFMLP(config).to(device=device, dtype=dtype).eval()
+x = [torch.randn(args.batch_size, args.num_tokens, args.vision_hidden_size, device=device, dtype=dtype) for _ in range(2)]
+
+with torch.inference_mode():
+    assert torch.equal(legacy_forward(module, x), module(x))
+    legacy = benchmark(lambda: legacy_forward(module, x), args.iterations, device)
+    current = benchmark(lambda: module(x), args.iterations, device)
+print(f"legacy: {legacy * 1000:.3f} ms, stack: {current * 1000:.3f} ms, speedup {legacy / current:.2f}x")
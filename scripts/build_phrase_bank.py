@@ -0,0 +1,23 @@
+import argparse
+import json
+
+from transformers import AutoTokenizer
+
+from tinyllava.model import LLMFactory, PhraseBank
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--tokenizer-path", type=str, required=True)
+parser.add_argument("--data-path", type=str, required=True, help="training data json with conversations")
+parser.add_argument("--output-path", type=str, required=True)
+parser.add_argument("--ngram-size", type=int, default=3)
+parser.add_argument("--min-count", type=int, default=2)
+args = parser.parse_args()
+
+# mine the assistant turns, the text the model generates, of the training conversations
+post_load = LLMFactory(args.tokenizer_path)[1][1]
+tokenizer = post_load(AutoTokenizer.from_pretrained(args.tokenizer_path, use_fast=True))
+samples = json.load(open(args.data_path, "r"))
+reports = [turn["value"] for sample in samples for turn in sample["conversations"] if turn["from"] == "gpt"]
+phrase_bank = PhraseBank.from_reports(reports, tokenizer, args.ngram_size, args.min_count)
+phrase_bank.save(args.output_path)
+print(f"Saved {len(phrase_bank)} {args.ngram_size}-grams from {len(reports)} reports to {args.output_path}")
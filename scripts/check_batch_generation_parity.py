@@ -0,0 +1,53 @@
+import argparse
+import json
+import os
+
+import torch
+from torch.nn.utils.rnn import pad_sequence
+
+from tinyllava.utils import *
+from tinyllava.data import *
+from tinyllava.model import *
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--model-path", type=str, required=True)
+parser.add_argument("--image-folder", type=str, default="")
+parser.add_argument("--question-file", type=str, required=True)
+parser.add_argument("--conv-mode", type=str, default="phi")
+parser.add_argument("--num-samples", type=int, default=8)
+parser.add_argument("--num-beams", type=int, default=1)
+parser.add_argument("--max-new-tokens", type=int, default=128)
+args = parser.parse_args()
+
+# greedy / beam search outputs of a mixed-length batch must match the ones of every prompt alone
+disable_torch_init()
+model, tokenizer, image_processor, context_len = load_pretrained_model(args.model_path)
+model.to(device='cuda')
+text_processor = TextPreprocess(tokenizer, args.conv_mode)
+image_processor = ImagePreprocess(image_processor, model.config)
+questions = [json.loads(q) for q in open(os.path.expanduser(args.question_file), "r")][:args.num_samples]
+
+input_ids_list, images = [], []
+for line in questions:
+    msg = Message()
+    msg.add_message(DEFAULT_IMAGE_TOKEN + '\n' + line["text"])
+    input_ids_list.append(text_processor(msg.messages, mode='eval')['input_ids'])
+    image = open_image(os.path.join(args.image_folder, line["image"]), image_processor.decode_size)
+    images.append(image_processor(image))
+images = torch.stack(images).half().cuda()
+generate_kwargs = dict(do_sample=False, num_beams=args.num_beams, max_new_tokens=args.max_new_tokens,
+                       pad_token_id=tokenizer.pad_token_id, use_cache=True)
+
+with torch.inference_mode():
+    single = [tokenizer.decode(model.generate(input_ids[None].cuda(), images=images[i:i + 1], **generate_kwargs)[0],
+                               skip_special_tokens=True).strip() for i, input_ids in enumerate(input_ids_list)]
+    input_ids = pad_sequence(input_ids_list, batch_first=True, padding_value=tokenizer.pad_token_id).cuda()
+    lengths = torch.tensor([len(x) for x in input_ids_list], device=input_ids.device)
+    attention_mask = torch.arange(input_ids.shape[1], device=input_ids.device)[None] < lengths[:, None]
+    batched = tokenizer.batch_decode(model.generate(input_ids, attention_mask=attention_mask, images=images,
+                                                    **generate_kwargs), skip_special_tokens=True)
+
+mismatches = [i for i, (a, b) in enumerate(zip(single, batched)) if a != b.strip()]
+print(f"{len(questions)} prompts, num_beams {args.num_beams}, mismatches {mismatches}")
+for i in mismatches:
+    print(f"--- {questions[i]['question_id']}\nbatch 1: {single[i]}\nbatched: {batched[i].strip()}")
@@ -0,0 +1,66 @@
+import argparse
+import json
+import os
+import sys
+
+import torch
+
+from tinyllava.utils import *
+from tinyllava.data import *
+from tinyllava.model import *
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--base-model-path", type=str, required=True)
+parser.add_argument("--adapter", type=str, nargs="+", required=True, help="name=path of a LoRA run")
+parser.add_argument("--image-folder", type=str, default="")
+parser.add_argument("--question-file", type=str, required=True)
+parser.add_argument("--conv-mode", type=str, default="phi")
+parser.add_argument("--num-samples", type=int, default=4)
+parser.add_argument("--max-new-tokens", type=int, default=128)
+args = parser.parse_args()
+
+# greedy outputs of every adapter served by MultiLoRAModel, requested interleaved with the other
+# adapters, must match the ones of the same run loaded alone by load_pretrained_model. The reference
+# merges the LoRA weights in fp16, a mismatch late in a long output can be rounding
+disable_torch_init()
+adapters = dict(a.split("=", 1) for a in args.adapter)
+questions = [json.loads(q) for q in open(os.path.expanduser(args.question_file), "r")][:args.num_samples]
+
+
+def generate_all(generate, tokenizer, image_processor, config):
+    text_processor = TextPreprocess(tokenizer, args.conv_mode)
+    image_processor = ImagePreprocess(image_processor, config)
+    outputs = []
+    for line in questions:
+        msg = Message()
+        msg.add_message(DEFAULT_IMAGE_TOKEN + '\n' + line["text"])
+        input_ids = text_processor(msg.messages, mode='eval')['input_ids'].unsqueeze(0).cuda()
+        image = open_image(os.path.join(args.image_folder, line["image"]), image_processor.decode_size)
+        with torch.inference_mode():
+            output_ids = generate(inputs=input_ids, images=image_processor(image).unsqueeze(0).half().cuda(),
+                                  image_sizes=[image.size], do_sample=False, num_beams=1,
+                                  max_new_tokens=args.max_new_tokens, pad_token_id=tokenizer.pad_token_id,
+                                  use_cache=True)
+        outputs.append(tokenizer.decode(output_ids[0], skip_special_tokens=True).strip())
+    return outputs
+
+
+reference = {}
+for name, path in adapters.items():
+    model, tokenizer, image_processor, _ = load_pretrained_model(path, cache_merged_lora=False)
+    model.to(device='cuda')
+    reference[name] = generate_all(model.generate, tokenizer, image_processor, model.config)
+    del model
+    torch.cuda.empty_cache()
+
+server = MultiLoRAModel(args.base_model_path, adapters, max_loaded_adapters=len(adapters))
+image_processor = server.model.vision_tower._image_processor
+failed = False
+# twice in turn, so that every adapter is selected again after the others
+for name in list(adapters) * 2:
+    outputs = generate_all(lambda **kwargs: server.generate(name, **kwargs), server.tokenizer,
+                           image_processor, server.model.config)
+    mismatches = [questions[i]["question_id"] for i, (a, b) in enumerate(zip(reference[name], outputs)) if a != b]
+    failed |= len(mismatches) > 0
+    print(f"{name}: {len(questions)} prompts, mismatches {mismatches}")
+sys.exit(1 if failed else 0)
@@ -0,0 +1,57 @@
+import argparse
+from types import SimpleNamespace
+
+import torch
+
+from tinyllava.model.connector.resampler import PerceiverResampler
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--vision-hidden-size", type=int, default=1152)
+parser.add_argument("--hidden-size", type=int, default=2560)
+parser.add_argument("--num-queries", type=int, default=64)
+parser.add_argument("--num-resampler-layers", type=int, default=3)
+parser.add_argument("--num-patches", type=int, default=729)
+parser.add_argument("--batch-size", type=int, default=4)
+args = parser.parse_args()
+
+
+def reference_attention(attn, x, latents):
+    # PerceiverAttention.forward before the switch to scaled_dot_product_attention
+    x = attn.norm_media(x)
+    latents = attn.norm_latents(latents)
+    b, n = latents.shape[:2]
+    q = attn.to_q(latents).view(b, n, attn.heads, -1).transpose(1, 2) * attn.scale
+    k, v = attn.to_kv(torch.cat((x, latents), dim=-2)).chunk(2, dim=-1)
+    k = k.view(b, k.shape[1], attn.heads, -1).transpose(1, 2)
+    v = v.view(b, v.shape[1], attn.heads, -1).transpose(1, 2)
+    sim = torch.einsum("... i d, ... j d -> ... i j", q, k)
+    sim = sim - sim.amax(dim=-1, keepdim=True).detach()
+    out = torch.einsum("... i j, ... j d -> ... i d", sim.softmax(dim=-1), v)
+    return attn.to_out(out.transpose(1, 2).reshape(b, n, -1))
+
+
+def reference_forward(module, x):
+    x = module.linear(x)
+    latents = module.latents.to(x.dtype).expand(x.shape[0], -1, -1)
+    for attn, ff in module.layers:
+        latents = reference_attention(attn, x, latents) + latents
+        latents = ff(latents) + latents
+    return module.norm(latents)
+
+
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+config = SimpleNamespace(vision_hidden_size=args.vision_hidden_size, hidden_size=args.hidden_size,
+                         num_queries=args.num_queries, num_resampler_layers=args.num_resampler_layers)
+torch.manual_seed(0)
+module = PerceiverResampler(config).to(device).eval()
+x = torch.randn(args.batch_size, args.num_patches, args.vision_hidden_size, device=device)
+
+for dtype, atol in [(torch.float32, 1e-4), (torch.bfloat16, 5e-2)]:
+    module.to(dtype)
+    with torch.inference_mode():
+        reference = reference_forward(module, x.to(dtype)).float()
+        result = module(x.to(dtype)).float()
+    assert result.shape == (args.batch_size, args.num_queries, args.hidden_size), result.shape
+    error = (result - reference).abs().max().item()
+    print(f"{dtype}: max abs error {error:.2e}")
+    assert error < atol, f"{dtype}: resampler output differs from the reference by {error}"
@@ -0,0 +1,55 @@
+import argparse
+import sys
+from types import SimpleNamespace
+
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+
+from tinyllava.model.static_generation import StaticCacheGenerator
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--attn-implementation", type=str, nargs="+", default=["sdpa", "eager"])
+parser.add_argument("--prompt-len", type=int, default=24)
+parser.add_argument("--max-new-tokens", type=int, default=48)
+parser.add_argument("--max-position-embeddings", type=int, default=128)
+parser.add_argument("--tokenizer-model-max-length", type=int, default=96)
+args = parser.parse_args()
+
+# greedy static cache generation of a tiny random llama must match the dynamic cache generate,
+# compiled or not, and repeated calls must not see the cache slots of the previous one. As in the
+# shipped models, tokenizer_model_max_length differs from the max_position_embeddings of the llm.
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+failed = False
+for attn_implementation in args.attn_implementation:
+    torch.manual_seed(0)
+    config = LlamaConfig(vocab_size=256, hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+                         num_attention_heads=4, max_position_embeddings=args.max_position_embeddings,
+                         attn_implementation=attn_implementation)
+    language_model = LlamaForCausalLM(config).to(device).eval()
+    model = SimpleNamespace(language_model=language_model, device=device, dtype=torch.float32,
+                            config=SimpleNamespace(tokenizer_model_max_length=args.tokenizer_model_max_length))
+    assert StaticCacheGenerator.is_supported(language_model)
+
+    inputs_embeds = torch.randn(1, args.prompt_len, config.hidden_size, device=device)
+    with torch.inference_mode():
+        reference_logits = language_model(inputs_embeds=inputs_embeds).logits[:, -1]
+        reference = language_model.generate(inputs_embeds=inputs_embeds, do_sample=False, eos_token_id=-1,
+                                            max_new_tokens=args.max_new_tokens)
+
+    for compile in [False, True]:
+        generator = StaticCacheGenerator(model, compile=compile)
+        generator.setup_cache()
+        with torch.inference_mode():
+            prefill_logits, _ = generator.prefill(inputs_embeds)
+        prefill_ok = torch.allclose(prefill_logits, reference_logits, atol=1e-4)
+        failed |= not prefill_ok
+        outputs = [generator.generate(inputs_embeds, max_new_tokens=args.max_new_tokens, eos_token_id=-1)
+                   for _ in range(2)]
+        generator.reset_cache()
+        for i, output in enumerate(outputs):
+            mismatch = (output[0] != reference[0, -output.shape[1]:]).nonzero()
+            first = mismatch[0].item() if len(mismatch) > 0 else None
+            failed |= first is not None or output.shape[1] != args.max_new_tokens
+            print(f"{attn_implementation} compile={compile} call {i}: prefill logits match {prefill_ok}, "
+                  f"first mismatch at step {first}")
+sys.exit(1 if failed else 0)
@@ -0,0 +1,68 @@
+import argparse
+import json
+import os
+import sys
+
+from transformers import AutoTokenizer
+
+from tinyllava.data import TemplateFactory
+from tinyllava.model import LLMFactory
+from tinyllava.utils.constants import IMAGE_TOKEN_INDEX
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--tokenizer-path", type=str, nargs="+",
+                    default=["microsoft/phi-2", "TinyLlama/TinyLlama-1.1B-Chat-v1.0"])
+parser.add_argument("--data-path", type=str,
+                    default=os.path.join(os.path.dirname(__file__), "data", "tokenizer_parity_sample.json"))
+parser.add_argument("--conv-version", type=str, nargs="+", default=["phi", "qwen2_base", "gemma", "llama"])
+parser.add_argument("--num-samples", type=int, default=1000)
+parser.add_argument("--model-max-length", type=int, default=2048)
+args = parser.parse_args()
+
+
+def reference_tokenizer_image_token(prompt, tokenizer):
+    # the per prompt implementation batch_tokenizer_image_token replaced
+    def _insert_separator(X, sep):
+        return [ele for sublist in zip(X, [sep] * len(X)) for ele in sublist][:-1]
+    prompt_chunks = [tokenizer(chunk).input_ids for chunk in prompt.split('<image>')]
+    input_ids = []
+    offset = 0
+    if len(prompt_chunks) > 0 and len(prompt_chunks[0]) > 0 and prompt_chunks[0][0] == tokenizer.bos_token_id:
+        offset = 1
+        input_ids.append(prompt_chunks[0][0])
+    for x in _insert_separator(prompt_chunks, [IMAGE_TOKEN_INDEX] * (offset + 1)):
+        input_ids.extend(x[offset:])
+    return input_ids
+
+
+# compare the slow tokenizer with the multi-pass labels against the fast tokenizer with the
+# single-pass and batched encoding for every template, and the batched tokenization against the
+# original per prompt one. Runs on a small bundled sample by default, exits 1 on any mismatch.
+samples = json.load(open(args.data_path, "r"))[:args.num_samples]
+failed = False
+for tokenizer_path in args.tokenizer_path:
+    post_load = LLMFactory(tokenizer_path)[1][1]
+    slow = post_load(AutoTokenizer.from_pretrained(tokenizer_path, use_fast=False, model_max_length=args.model_max_length))
+    fast = post_load(AutoTokenizer.from_pretrained(tokenizer_path, use_fast=True, model_max_length=args.model_max_length))
+
+    for version in args.conv_version:
+        template = TemplateFactory(version)()
+        template.cache_size = 0
+        conversations = [sample["conversations"] for sample in samples]
+        batched = template.encode_batch(conversations, fast, mode='train')
+        prompts = [template.prompt(*template.get_list_from_message(messages)) for messages in conversations]
+        mismatches = {"input_ids": 0, "labels": 0, "batched": 0, "reference": 0}
+        for messages, prompt, batch_result in zip(conversations, prompts, batched):
+            reference = template.encode(messages, slow, mode='train')
+            result = template.encode(messages, fast, mode='train')
+            mismatches["input_ids"] += int(not reference["input_ids"].equal(result["input_ids"]))
+            mismatches["labels"] += int(not reference["labels"].equal(result["labels"]))
+            mismatches["batched"] += int(not (batch_result["input_ids"].equal(result["input_ids"])
+                                              and batch_result["labels"].equal(result["labels"])))
+            for tokenizer in [slow, fast]:
+                mismatches["reference"] += int(template.tokenizer_image_token(prompt, tokenizer)
+                                               != reference_tokenizer_image_token(prompt, tokenizer))
+        failed |= any(mismatches.values())
+        print(f"{tokenizer_path} {version}: {len(samples)} samples, mismatches {mismatches}")
+
+sys.exit(1 if failed else 0)
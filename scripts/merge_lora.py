@@ -0,0 +1,11 @@
+import argparse
+
+from tinyllava.model import merge_lora_checkpoint
+
+# writes <model-path>/merged, the directory load_pretrained_model loads a LoRA run from
+parser = argparse.ArgumentParser()
+parser.add_argument("--model-path", type=str, required=True)
+parser.add_argument("--force", action="store_true", help="remove a stale merged directory first")
+args = parser.parse_args()
+
+merge_lora_checkpoint(args.model_path, args.force)
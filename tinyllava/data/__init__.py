@@ -1,4 +1,5 @@
 from .template import *
 from .image_preprocess import *
+from .image_cache import *
 from .text_preprocess import *
 from .dataset import *
\ No newline at end of file
@@ -2,13 +2,15 @@ import copy
 from dataclasses import dataclass
 import json
 from typing import Dict,  Sequence, TYPE_CHECKING
-from PIL import Image, ImageFile
+from PIL import ImageFile
 import os
 
 from .text_preprocess import TextPreprocess
 from .image_preprocess import ImagePreprocess
+from .image_cache import ImageCache
 from ..utils.arguments import DataArguments
 from ..utils.constants import *
+from ..utils.data_utils import open_image
 
 
 import transformers
@@ -33,6 +35,10 @@ class LazySupervisedDataset(Dataset):
         self.data_args = data_args
         self.text_preprocess = TextPreprocess(tokenizer, data_args.conv_version)
         self.image_preprocess = ImagePreprocess(data_args.image_processor, data_args)
+        self.image_cache = None
+        if getattr(data_args, 'image_cache_dir', None) is not None:
+            self.image_cache = ImageCache(data_args.image_cache_dir, [sample.get('image') for sample in list_data_dict],
+                                          data_args.image_folder, self.image_preprocess)
 
     def __len__(self):
         return len(self.list_data_dict)
@@ -57,10 +63,12 @@ class LazySupervisedDataset(Dataset):
     def __getitem__(self, i) -> Dict[str, torch.Tensor]:
         sources = self.list_data_dict[i]
         data_dict = self.text_preprocess(copy.deepcopy(sources["conversations"]))
-        if 'image' in sources:
+        if 'image' in sources and self.image_cache is not None:
+            data_dict['image'] = self.image_cache[i]
+        elif 'image' in sources:
             image_file = self.list_data_dict[i]['image']
             image_folder = self.data_args.image_folder
-            image = Image.open(os.path.join(image_folder, image_file)).convert('RGB')
+            image = open_image(os.path.join(image_folder, image_file), self.image_preprocess.decode_size)
             image = self.image_preprocess(image)
             data_dict['image'] = image
         elif self.data_args.is_multimodal:
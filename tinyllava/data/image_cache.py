@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import torch
+
+from ..utils.data_utils import open_image
+from ..utils.logging import log
+
+
+class ImageCache:
+    """
+    Memory-mapped cache of the resized uint8 pixels (before normalization) of every image of a dataset.
+    Images are decoded and resized by the first worker that reads them, later epochs only slice the
+    cache and normalize. The cache lives in a directory keyed by the image list and the preprocessing
+    config, so changing either starts a new cache. Anyres preprocessing is not supported.
+    A dataset of grayscale images (judged by its first image) is cached with a single channel that is
+    broadcast to RGB when read, unless padding with a colored background makes the channels differ.
+    Color images of such a dataset are preprocessed on every read instead of cached.
+    """
+    def __init__(self, cache_dir, image_files, image_folder, image_preprocess):
+        assert image_preprocess.image_aspect_ratio != 'anyres', 'the image cache does not support anyres images'
+        self.image_files = image_files
+        self.image_folder = image_folder
+        self.image_preprocess = image_preprocess
+        self.num_channels = self.get_num_channels()
+        self.cache_path = os.path.join(cache_dir, self.get_key())
+        self._pixels = None
+        self._done = None
+        if not os.path.exists(self.cache_path):
+            self.create(cache_dir)
+
+    def get_num_channels(self):
+        first = next(f for f in self.image_files if f is not None)
+        image = open_image(os.path.join(self.image_folder, first), self.image_preprocess.decode_size,
+                           keep_grayscale=True)
+        gray_background = len(set(self.image_preprocess.image_processor.image_mean)) == 1
+        if image.mode == 'L' and (self.image_preprocess.image_aspect_ratio != 'pad' or gray_background):
+            return 1
+        return 3
+
+    def get_key(self):
+        processor = self.image_preprocess.image_processor
+        config = {
+            'image_folder': self.image_folder,
+            'image_aspect_ratio': self.image_preprocess.image_aspect_ratio,
+            'size': processor.size,
+            'crop_size': getattr(processor, 'crop_size', None),
+            'do_center_crop': getattr(processor, 'do_center_crop', None),
+            'image_mean': processor.image_mean,
+            'num_channels': self.num_channels,
+            'image_files': hashlib.sha1(json.dumps(self.image_files).encode()).hexdigest(),
+        }
+        return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+    def create(self, cache_dir):
+        first = next(i for i, f in enumerate(self.image_files) if f is not None)
+        shape = (self.num_channels,) + tuple(self.load_pixels(first).shape[1:])
+        # build the cache in a temporary directory and rename it, concurrent ranks keep the first one
+        tmp_path = f'{self.cache_path}.tmp{os.getpid()}'
+        os.makedirs(tmp_path, exist_ok=True)
+        np.lib.format.open_memmap(os.path.join(tmp_path, 'pixels.npy'), mode='w+', dtype=np.uint8,
+                                  shape=(len(self.image_files),) + tuple(shape)).flush()
+        np.lib.format.open_memmap(os.path.join(tmp_path, 'done.npy'), mode='w+', dtype=np.uint8,
+                                  shape=(len(self.image_files),)).flush()
+        try:
+            os.rename(tmp_path, self.cache_path)
+            log(f'Created image cache {self.cache_path}')
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def open(self):
+        # opened lazily so that every dataloader worker maps the files itself
+        self._pixels = np.load(os.path.join(self.cache_path, 'pixels.npy'), mmap_mode='r+')
+        self._done = np.load(os.path.join(self.cache_path, 'done.npy'), mmap_mode='r+')
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pixels'] = None
+        state['_done'] = None
+        return state
+
+    def load_pixels(self, i):
+        image = open_image(os.path.join(self.image_folder, self.image_files[i]), self.image_preprocess.decode_size,
+                           keep_grayscale=True)
+        image = self.image_preprocess.to_tensor(image)
+        if self.image_preprocess.image_aspect_ratio == 'pad':
+            background_color = tuple(int(x * 255) for x in self.image_preprocess.image_processor.image_mean)
+            image = self.image_preprocess.expand2square_tensor(image, background_color)
+        image = self.image_preprocess.resize_tensor(image[None])[0]
+        if image.shape[0] < self.num_channels:
+            image = image.expand(self.num_channels, -1, -1)
+        return image.to(torch.uint8)
+
+    def __getitem__(self, i):
+        if self._pixels is None:
+            self.open()
+        if self._done[i]:
+            pixels = torch.from_numpy(np.array(self._pixels[i]))
+        else:
+            pixels = self.load_pixels(i)
+            if pixels.shape[0] == self.num_channels:
+                self._pixels[i] = pixels.numpy()
+                self._done[i] = 1
+        return self.image_preprocess.normalize(pixels.expand(3, -1, -1)[None].float())[0]
@@ -1,8 +1,11 @@
 import os
 
 from PIL import Image, ImageFile
+import numpy as np
 import torch
+import torch.nn.functional as F
 import ast
+import math
 
 from ..utils.data_utils import *
 
@@ -25,6 +28,87 @@ class ImagePreprocess:
         image = self.image_processor(image, return_tensors='pt')['pixel_values'][0]
         return image
 
+    @property
+    def decode_size(self):
+        """
+        Smallest image side the preprocessing needs, for decoding images at reduced resolution with open_image.
+        None with anyres, which uses the full resolution.
+        """
+        if self.image_aspect_ratio == "anyres":
+            return None
+        size = self.image_processor.size
+        return max(size.get('shortest_edge', 0), size.get('height', 0), size.get('width', 0))
+
+    def batch(self, images, device=None):
+        """
+        Preprocess a list of decoded images (PIL images or uint8 tensors of shape [C, H, W]) with tensor ops,
+        optionally on device. The resize is an antialiased bicubic interpolation instead of PIL's, so pixel
+        values can differ slightly from __call__.
+
+        Returns:
+            torch.Tensor: The stacked [B, C, H, W] batch, or with anyres a list of [N, C, H, W] patch tensors.
+        """
+        images = [self.to_tensor(image).to(device) for image in images]
+        if self.image_aspect_ratio == "anyres":
+            return [self.normalize(self.process_anyres_image_tensor(image)) for image in images]
+        if self.image_aspect_ratio == 'pad':
+            background_color = tuple(int(x * 255) for x in self.image_processor.image_mean)
+            images = [self.expand2square_tensor(image, background_color) for image in images]
+        images = torch.cat([self.resize_tensor(image[None]).expand(-1, 3, -1, -1) for image in images])
+        return self.normalize(images)
+
+    @classmethod
+    def to_tensor(cls, image):
+        # grayscale images stay single-channel, they are broadcast to RGB after the resize
+        if isinstance(image, Image.Image) and image.mode == 'L':
+            image = torch.from_numpy(np.asarray(image))
+        elif isinstance(image, Image.Image):
+            image = torch.from_numpy(np.asarray(image.convert('RGB'))).permute(2, 0, 1)
+        if image.dim() == 2:
+            image = image[None]
+        return image
+
+    @classmethod
+    def expand2square_tensor(cls, image, background_color):
+        channels, height, width = image.shape
+        if width == height:
+            return image
+        if channels == 1 and len(set(background_color)) > 1:
+            image = image.expand(3, -1, -1)
+        size = max(width, height)
+        result = torch.tensor(background_color[:image.shape[0]], dtype=image.dtype, device=image.device)
+        result = result.view(-1, 1, 1).repeat(1, size, size)
+        top, left = (size - height) // 2, (size - width) // 2
+        result[:, top:top + height, left:left + width] = image
+        return result
+
+    def resize_tensor(self, images):
+        """
+        Resize (and center crop) a [B, C, H, W] batch of equally sized images to the input size of the image processor.
+        """
+        size = self.image_processor.size
+        height, width = images.shape[-2:]
+        if 'shortest_edge' in size:
+            short, long = (width, height) if width <= height else (height, width)
+            new_short, new_long = size['shortest_edge'], int(size['shortest_edge'] * long / short)
+            new_size = (new_long, new_short) if width <= height else (new_short, new_long)
+        else:
+            new_size = (size['height'], size['width'])
+        images = images.float()
+        if tuple(new_size) != (height, width):
+            images = F.interpolate(images, size=new_size, mode='bicubic', align_corners=False, antialias=True)
+            images = images.round().clamp(0, 255)
+        if getattr(self.image_processor, 'do_center_crop', False):
+            crop_height, crop_width = self.image_processor.crop_size['height'], self.image_processor.crop_size['width']
+            top, left = (new_size[0] - crop_height) // 2, (new_size[1] - crop_width) // 2
+            images = images[:, :, top:top + crop_height, left:left + crop_width]
+        return images
+
+    def normalize(self, images):
+        mean = torch.tensor(self.image_processor.image_mean, device=images.device).view(1, -1, 1, 1)
+        std = torch.tensor(self.image_processor.image_std, device=images.device).view(1, -1, 1, 1)
+        return (images * self.image_processor.rescale_factor - mean) / std
+
     @classmethod
     def expand2square(cls, pil_img, background_color):
         width, height = pil_img.size
@@ -67,4 +151,36 @@ class ImagePreprocess:
         image_patches = [processor(image_patch, return_tensors='pt')['pixel_values'][0]
                         for image_patch in image_patches]
         return torch.stack(image_patches, dim=0)
+
+    def process_anyres_image_tensor(self, image):
+        """
+        Tensor version of process_anyres_image for a uint8 [C, H, W] image, returning the resized [N, C, H, W]
+        patches before normalization.
+        """
+        if type(self.image_grid_pinpoints) is list:
+            possible_resolutions = self.image_grid_pinpoints
+        else:
+            possible_resolutions = ast.literal_eval(self.image_grid_pinpoints)
+        image = image.expand(3, -1, -1)
+        channels, height, width = image.shape
+        target_width, target_height = select_best_resolution((width, height), possible_resolutions)
+        scale_w, scale_h = target_width / width, target_height / height
+        if scale_w < scale_h:
+            new_width, new_height = target_width, min(math.ceil(height * scale_w), target_height)
+        else:
+            new_width, new_height = min(math.ceil(width * scale_h), target_width), target_height
+        resized = F.interpolate(image[None].float(), size=(new_height, new_width), mode='bicubic',
+                                align_corners=False, antialias=True).round().clamp(0, 255)
+        padded = resized.new_zeros(1, channels, target_height, target_width)
+        top, left = (target_height - new_height) // 2, (target_width - new_width) // 2
+        padded[:, :, top:top + new_height, left:left + new_width] = resized
+
+        patch_size = self.image_processor.crop_size['height']
+        patches = padded[0].unfold(1, patch_size, patch_size).unfold(2, patch_size, patch_size)
+        patches = patches.permute(1, 2, 0, 3, 4).reshape(-1, channels, patch_size, patch_size)
+
+        shortest_edge = self.image_processor.size['shortest_edge']
+        image_original_resize = F.interpolate(image[None].float(), size=(shortest_edge, shortest_edge), mode='bicubic',
+                                              align_corners=False, antialias=True).round().clamp(0, 255)
+        return torch.cat([self.resize_tensor(image_original_resize), self.resize_tensor(patches)])
     
@@ -1,6 +1,6 @@
+from collections import Counter, OrderedDict
 from dataclasses import dataclass
-from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple, Union
-import copy
+from typing import TYPE_CHECKING, ClassVar, Dict, List, Optional, Sequence, Tuple, Union
 
 from .formatter import EmptyFormatter, StringFormatter
 from .formatter import Formatter
@@ -18,6 +18,12 @@ class Template:
     format_assistant: "Formatter"
     system: "Formatter"
     separator: "Formatter"
+    # number of encodings kept per template instance (i.e. per dataloader worker), 0 disables the cache
+    cache_size: ClassVar[int] = 20000
+    # per process counters of cache hits, single-pass encodings and tokenization mismatches
+    stats: ClassVar[Counter] = Counter()
+    # whether labels_from_offsets was verified to match make_labels for this template
+    single_pass_labels: ClassVar[bool] = False
     
     def encode(self, messages, tokenizer, mode='train'):
         """
@@ -26,18 +32,58 @@ class Template:
         2. prompt two list
         3. tokenize prompt
         4. make target
+        Encodings are cached by tokenizer, mode and message content.
         """
+        key = (tokenizer.name_or_path, mode, tuple((message['from'], message['value']) for message in messages))
+        cache = self.__dict__.setdefault('_encode_cache', OrderedDict())
+        if key in cache:
+            cache.move_to_end(key)
+            self.stats['cache_hits'] += 1
+            return self._from_cache(cache[key])
+
         question_list, answer_list = self.get_list_from_message(messages)
         prompt = self.prompt(question_list, answer_list)
-        input_ids = self.tokenizer_image_token(prompt, tokenizer, return_tensors='pt')
-        if mode == 'train':
+        if mode == 'train' and getattr(tokenizer, 'is_fast', False) and self.single_pass_labels:
+            input_ids, labels = self.tokenize_with_labels(prompt, tokenizer)
+            result = dict(input_ids=input_ids, labels=labels)
+        elif mode == 'train':
+            input_ids = self.tokenizer_image_token(prompt, tokenizer, return_tensors='pt')
             labels = self.make_labels(input_ids, prompt, tokenizer)
-            return dict(
-                input_ids=input_ids,
-                labels=labels
-            )
+            result = dict(input_ids=input_ids, labels=labels)
         else:
-            return dict(input_ids=input_ids, prompt=prompt)
+            input_ids = self.tokenizer_image_token(prompt, tokenizer, return_tensors='pt')
+            result = dict(input_ids=input_ids, prompt=prompt)
+
+        if self.cache_size > 0:
+            # stored as int32, _from_cache returns fresh int64 copies the caller may modify
+            cache[key] = {k: v.int() if isinstance(v, torch.Tensor) else v for k, v in result.items()}
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return result
+
+    def encode_batch(self, messages_list, tokenizer, mode='eval'):
+        """
+        Encode several conversations with one batched tokenizer call. In train mode, slow tokenizers and
+        templates without single_pass_labels fall back to encode per conversation.
+        """
+        single_pass = getattr(tokenizer, 'is_fast', False) and self.single_pass_labels
+        if mode == 'train' and not single_pass:
+            return [self.encode(messages, tokenizer, mode) for messages in messages_list]
+        prompts = [self.prompt(*self.get_list_from_message(messages)) for messages in messages_list]
+        if mode == 'train':
+            batch_input_ids, batch_offsets = self.batch_tokenizer_image_token(prompts, tokenizer, return_offsets=True)
+            results = []
+            for prompt, input_ids, offsets in zip(prompts, batch_input_ids, batch_offsets):
+                input_ids, labels = self.labels_from_offsets(prompt, input_ids, offsets)
+                results.append(dict(input_ids=input_ids, labels=labels))
+            return results
+        batch_input_ids = self.batch_tokenizer_image_token(prompts, tokenizer)
+        return [dict(input_ids=torch.tensor(input_ids, dtype=torch.long), prompt=prompt)
+                for prompt, input_ids in zip(prompts, batch_input_ids)]
+
+    @staticmethod
+    def _from_cache(result):
+        return {k: v.long() if isinstance(v, torch.Tensor) else v for k, v in result.items()}
         
     
     def get_list_from_message(self, messages):
@@ -90,8 +136,48 @@ class Template:
             msg += self.format_assistant.apply(content=answer)
         return msg
     
+    def tokenize_with_labels(self, prompt, tokenizer):
+        """
+        Single-pass alternative to make_labels for fast tokenizers: the prompt is tokenized once with
+        offsets and the tokens overlapping an answer (including its eos) are kept as labels. The answer
+        spans are found by splitting the prompt into rounds as _make_masks does.
+        """
+        input_ids, offsets = self.tokenizer_image_token(prompt, tokenizer, return_offsets=True)
+        return self.labels_from_offsets(prompt, input_ids, offsets)
+
+    def labels_from_offsets(self, prompt, input_ids, offsets):
+        sep, eos_token = self.separator.apply()
+        spans = []
+        start = 0
+        for rou in prompt.split(eos_token) if eos_token else []:
+            if rou == "":
+                break
+            parts = rou.split(sep)
+            if len(parts) != 2:
+                break
+            spans.append((start + len(parts[0]) + len(sep), start + len(rou) + len(eos_token)))
+            start += len(rou) + len(eos_token)
+
+        self.stats['single_pass'] += 1
+        if start < len(prompt) or len(offsets) != len(input_ids):
+            # as make_labels, a prompt whose rounds cannot all be parsed is not trained on
+            self._record_mismatch(f"{start} of {len(prompt)} characters in rounds")
+            return torch.tensor(input_ids, dtype=torch.long), torch.full((len(input_ids),), IGNORE_INDEX, dtype=torch.long)
+        labels = [
+            token if token != IMAGE_TOKEN_INDEX and any(end > s and begin < e for s, e in spans) else IGNORE_INDEX
+            for token, (begin, end) in zip(input_ids, offsets)
+        ]
+        return torch.tensor(input_ids, dtype=torch.long), torch.tensor(labels, dtype=torch.long)
+
+    def _record_mismatch(self, detail):
+        self.stats['tokenization_mismatches'] += 1
+        mismatches = self.stats['tokenization_mismatches']
+        if mismatches & (mismatches - 1) == 0:
+            # warn on the 1st, 2nd, 4th, 8th, ... mismatch of this process
+            print(f"WARNING: tokenization mismatch: {detail}. (ignored, {mismatches} mismatches so far)")
+
     def make_labels(self, input_ids, prompt, tokenizer):
-        labels = copy.deepcopy(input_ids)
+        labels = input_ids.clone()
         sep, eos_token = self.separator.apply()
         total_len = int(labels.ne(tokenizer.pad_token_id).sum())
         if tokenizer.pad_token_id == tokenizer.eos_token_id:
@@ -100,18 +186,8 @@ class Template:
         eos_token_length = len(tokenizer.encode(eos_token))
         labels, cur_len = self._make_masks(labels, tokenizer, sep, eos_token_length, rounds)
         if cur_len < tokenizer.model_max_length:
-            import time
             if cur_len != total_len:
-                print(
-                    f"WARNING: tokenization mismatch: {cur_len} vs. {total_len}."
-                    f" (ignored)"
-                )
-                print("number of rounds: ", len(rounds) - 1)
-                print("rounds: ", rounds[:-1])
-                print("prompt: ", prompt)
-                print(labels)
-                print(input_ids)
-                time.sleep(5)
+                self._record_mismatch(f"{cur_len} vs. {total_len}")
                 labels[:] = IGNORE_INDEX
         return labels
         
@@ -134,27 +210,54 @@ class Template:
         return labels, cur_len
         
     @classmethod    
-    def tokenizer_image_token(cls, prompt, tokenizer, image_token_index=IMAGE_TOKEN_INDEX, return_tensors=None):
-        def _insert_separator(X, sep):
-            return [ele for sublist in zip(X, [sep]*len(X)) for ele in sublist][:-1]
-        prompt_chunks = [tokenizer(chunk).input_ids for chunk in prompt.split('<image>')]
-
-        input_ids = []
-        offset = 0
-        if len(prompt_chunks) > 0 and len(prompt_chunks[0]) > 0 and prompt_chunks[0][0] == tokenizer.bos_token_id:
-            offset = 1
-            input_ids.append(prompt_chunks[0][0])
-
-        for x in _insert_separator(prompt_chunks, [image_token_index] * (offset + 1)):
-            input_ids.extend(x[offset:])
-
+    def tokenizer_image_token(cls, prompt, tokenizer, image_token_index=IMAGE_TOKEN_INDEX, return_tensors=None,
+                              return_offsets=False):
+        """
+        Tokenize prompt, replacing every <image> by image_token_index. With return_offsets (fast tokenizers only)
+        the (start, end) character span of every token in prompt is returned as well.
+        """
+        if return_offsets:
+            input_ids, offsets = cls.batch_tokenizer_image_token([prompt], tokenizer, image_token_index, return_offsets=True)
+            return input_ids[0], offsets[0]
+        input_ids = cls.batch_tokenizer_image_token([prompt], tokenizer, image_token_index)[0]
         if return_tensors is not None:
             if return_tensors == 'pt':
                 return torch.tensor(input_ids, dtype=torch.long)
             raise ValueError(f'Unsupported tensor type: {return_tensors}')
         return input_ids
 
+    @classmethod
+    def batch_tokenizer_image_token(cls, prompts, tokenizer, image_token_index=IMAGE_TOKEN_INDEX, return_offsets=False):
+        """
+        Batched tokenizer_image_token: the text chunks of all prompts are encoded in a single tokenizer call
+        (parallel for fast tokenizers) and image_token_index is spliced in between. Returns a list of input_ids
+        lists, and with return_offsets a list of character span lists.
+        """
+        chunks = [prompt.split('<image>') for prompt in prompts]
+        flat_chunks = [chunk for prompt_chunks in chunks for chunk in prompt_chunks]
+        encodings = tokenizer(flat_chunks, return_offsets_mapping=return_offsets)
 
-
-
-
+        batch_input_ids, batch_offsets = [], []
+        i = 0
+        for prompt_chunks in chunks:
+            input_ids, offsets = [], []
+            chunk_start = 0
+            first_ids = encodings['input_ids'][i]
+            # when the first chunk starts with bos, the first token of every later chunk is its bos and is dropped
+            starts_with_bos = len(first_ids) > 0 and first_ids[0] == tokenizer.bos_token_id
+            for j, chunk in enumerate(prompt_chunks):
+                chunk_ids = encodings['input_ids'][i + j]
+                skip = 1 if j > 0 and starts_with_bos else 0
+                if j > 0:
+                    input_ids.append(image_token_index)
+                    offsets.append((chunk_start - len('<image>'), chunk_start))
+                input_ids.extend(chunk_ids[skip:])
+                if return_offsets:
+                    offsets.extend((chunk_start + b, chunk_start + e) for b, e in encodings['offset_mapping'][i + j][skip:])
+                chunk_start += len(chunk) + len('<image>')
+            i += len(prompt_chunks)
+            batch_input_ids.append(input_ids)
+            batch_offsets.append(offsets)
+        if return_offsets:
+            return batch_input_ids, batch_offsets
+        return batch_input_ids
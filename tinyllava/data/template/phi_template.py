@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple, Union
+from typing import TYPE_CHECKING, ClassVar, Dict, List, Optional, Sequence, Tuple, Union
 
 from .formatter import EmptyFormatter, StringFormatter
 from .base import Template
@@ -19,6 +19,7 @@ class PhiTemplate(Template):
     format_assistant: "Formatter" = StringFormatter(slot="ASSISTANT" + ": " + "{{content}}" + "<|endoftext|>")
     system: "Formatter" = EmptyFormatter(slot=system+" ")
     separator: "Formatter" = EmptyFormatter(slot=[' ASSISTANT: ', '<|endoftext|>'])
+    single_pass_labels: ClassVar[bool] = True
 
 
 
@@ -9,4 +9,7 @@ class TextPreprocess:
         self.template = TemplateFactory(version)()
     
     def __call__(self, messages, mode='train'):
-        return self.template.encode(messages, self.tokenizer, mode)
\ No newline at end of file
+        return self.template.encode(messages, self.tokenizer, mode)
+
+    def batch(self, messages_list, mode='eval'):
+        return self.template.encode_batch(messages_list, self.tokenizer, mode)
\ No newline at end of file
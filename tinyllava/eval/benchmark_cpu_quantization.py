@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import time
+
+import torch
+from tqdm import tqdm
+
+from tinyllava.utils import *
+from tinyllava.data import *
+from tinyllava.model import *
+
+
+
+MODES = ['fp32', 'bf16', 'int8', 'int4']
+
+
+def generate_reports(args, mode, questions):
+    model, tokenizer, image_processor, context_len = load_pretrained_model(
+        args.model_path, device='cpu', cpu_quantization=None if mode == 'fp32' else mode)
+    model.eval()
+    weight_bytes = sum(t.numel() * t.element_size() for t in list(model.parameters()) + list(model.buffers()))
+    text_processor = TextPreprocess(tokenizer, args.conv_mode)
+    image_processor = ImagePreprocess(image_processor, model.config)
+
+    outputs, seconds, num_tokens = {}, 0., 0
+    for line in tqdm(questions, desc=mode):
+        msg = Message()
+        msg.add_message(DEFAULT_IMAGE_TOKEN + '\n' + line["text"])
+        input_ids = text_processor(msg.messages, mode='eval')['input_ids'].unsqueeze(0)
+        image = open_image(os.path.join(args.image_folder, line["image"]), image_processor.decode_size)
+        image_tensor = image_processor(image).unsqueeze(0).to(dtype=model.dtype)
+
+        start = time.time()
+        with torch.inference_mode():
+            output_ids = model.generate(
+                input_ids,
+                images=image_tensor,
+                image_sizes=[image.size],
+                do_sample=False,
+                num_beams=1,
+                max_new_tokens=args.max_new_tokens,
+                pad_token_id=tokenizer.pad_token_id,
+                use_cache=True)
+        seconds += time.time() - start
+        num_tokens += output_ids.shape[-1]
+        outputs[line["question_id"]] = tokenizer.batch_decode(output_ids, skip_special_tokens=True)[0].strip()
+    return outputs, seconds, num_tokens, weight_bytes
+
+
+def average_metrics(references, hypotheses):
+    from tinyllava.eval.generate_metrics_and_average_reports import compare_texts
+    sums = {}
+    keys = [k for k in hypotheses if k in references]
+    for k in keys:
+        for metric, value in compare_texts(references[k], hypotheses[k]).items():
+            sums[metric] = sums.get(metric, 0) + value
+    return {metric: value / max(len(keys), 1) for metric, value in sums.items()}
+
+
+def benchmark(args):
+    disable_torch_init()
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+    questions = [json.loads(q) for q in open(os.path.expanduser(args.question_file), "r")][:args.num_samples]
+    answers = None
+    if args.answers_file is not None:
+        answers = {}
+        for line in open(os.path.expanduser(args.answers_file), "r"):
+            line = json.loads(line)
+            answers[line["question_id"]] = line["text"]
+
+    results = {}
+    reference_outputs = None
+    for mode in ['fp32'] + [m for m in args.modes if m != 'fp32']:
+        outputs, seconds, num_tokens, weight_bytes = generate_reports(args, mode, questions)
+        if reference_outputs is None:
+            reference_outputs = outputs
+        if mode not in args.modes:
+            continue
+        results[mode] = {
+            "seconds_per_report": seconds / len(questions),
+            "tokens_per_second": num_tokens / seconds,
+            "weight_megabytes": weight_bytes / 2 ** 20,
+            "vs_fp32": average_metrics(reference_outputs, outputs),
+        }
+        if answers is not None:
+            results[mode]["vs_reference"] = average_metrics(answers, outputs)
+        print(mode, json.dumps(results[mode], indent=4))
+
+    if args.output_file is not None:
+        with open(args.output_file, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-path", type=str, required=True)
+    parser.add_argument("--image-folder", type=str, default="")
+    parser.add_argument("--question-file", type=str, required=True)
+    parser.add_argument("--answers-file", type=str, default=None, help="ground truth reports, jsonl with question_id and text")
+    parser.add_argument("--output-file", type=str, default=None)
+    parser.add_argument("--conv-mode", type=str, default="phi")
+    parser.add_argument("--num-samples", type=int, default=20)
+    parser.add_argument("--max-new-tokens", type=int, default=256)
+    parser.add_argument("--num-threads", type=int, default=None)
+    parser.add_argument("--modes", type=str, nargs="+", default=MODES, choices=MODES)
+    args = parser.parse_args()
+
+    benchmark(args)
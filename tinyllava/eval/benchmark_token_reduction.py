@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import time
+
+import torch
+from tqdm import tqdm
+
+from tinyllava.utils import *
+from tinyllava.data import *
+from tinyllava.model import *
+from tinyllava.eval.benchmark_cpu_quantization import average_metrics
+
+
+MODES = ['none', 'pool2', 'pool4', 'merge2', 'merge4']
+
+
+def synchronize():
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+
+def generate_reports(args, model, tokenizer, text_processor, image_processor, mode, questions):
+    set_image_token_reduction(model, None if mode == 'none' else mode)
+    outputs, prefill_seconds, seconds, num_image_tokens = {}, 0., 0., 0
+    for line in tqdm(questions, desc=mode):
+        msg = Message()
+        msg.add_message(DEFAULT_IMAGE_TOKEN + '\n' + line["text"])
+        input_ids = text_processor(msg.messages, mode='eval')['input_ids'].unsqueeze(0).cuda()
+        image = open_image(os.path.join(args.image_folder, line["image"]), image_processor.decode_size)
+        image_tensor = image_processor(image).unsqueeze(0).to(device='cuda', dtype=model.dtype)
+        generate_kwargs = dict(images=image_tensor, image_sizes=[image.size], do_sample=False, num_beams=1,
+                               pad_token_id=tokenizer.pad_token_id, use_cache=True)
+
+        with torch.inference_mode():
+            num_image_tokens += model.encode_images(image_tensor).shape[1]
+            # a single new token measures the prefill
+            synchronize()
+            start = time.time()
+            model.generate(input_ids, max_new_tokens=1, **generate_kwargs)
+            synchronize()
+            prefill_seconds += time.time() - start
+
+            start = time.time()
+            output_ids = model.generate(input_ids, max_new_tokens=args.max_new_tokens, **generate_kwargs)
+            synchronize()
+            seconds += time.time() - start
+        outputs[line["question_id"]] = tokenizer.batch_decode(output_ids, skip_special_tokens=True)[0].strip()
+    return outputs, {
+        "image_tokens": num_image_tokens / len(questions),
+        "prefill_seconds": prefill_seconds / len(questions),
+        "seconds_per_report": seconds / len(questions),
+    }
+
+
+def benchmark(args):
+    disable_torch_init()
+    questions = [json.loads(q) for q in open(os.path.expanduser(args.question_file), "r")][:args.num_samples]
+    answers = None
+    if args.answers_file is not None:
+        answers = {}
+        for line in open(os.path.expanduser(args.answers_file), "r"):
+            line = json.loads(line)
+            answers[line["question_id"]] = line["text"]
+
+    model, tokenizer, image_processor, context_len = load_pretrained_model(args.model_path)
+    model.to(device='cuda')
+    model.eval()
+    text_processor = TextPreprocess(tokenizer, args.conv_mode)
+    image_processor = ImagePreprocess(image_processor, model.config)
+
+    results = {}
+    reference_outputs = None
+    for mode in ['none'] + [m for m in args.modes if m != 'none']:
+        outputs, result = generate_reports(args, model, tokenizer, text_processor, image_processor, mode, questions)
+        if reference_outputs is None:
+            reference_outputs = outputs
+        if mode not in args.modes:
+            continue
+        result["vs_none"] = average_metrics(reference_outputs, outputs)
+        if answers is not None:
+            result["vs_reference"] = average_metrics(answers, outputs)
+        results[mode] = result
+        print(mode, json.dumps(result, indent=4))
+
+    if args.output_file is not None:
+        with open(args.output_file, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-path", type=str, required=True)
+    parser.add_argument("--image-folder", type=str, default="")
+    parser.add_argument("--question-file", type=str, required=True)
+    parser.add_argument("--answers-file", type=str, default=None, help="ground truth reports, jsonl with question_id and text")
+    parser.add_argument("--output-file", type=str, default=None)
+    parser.add_argument("--conv-mode", type=str, default="phi")
+    parser.add_argument("--num-samples", type=int, default=50)
+    parser.add_argument("--max-new-tokens", type=int, default=256)
+    parser.add_argument("--modes", type=str, nargs="+", default=MODES, help="none, pool{factor} or merge{factor}")
+    args = parser.parse_args()
+
+    benchmark(args)
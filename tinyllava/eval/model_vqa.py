@@ -9,7 +9,6 @@ from tinyllava.utils import *
 from tinyllava.data import *
 from tinyllava.model import *
 
-from PIL import Image
 import math
 
 
@@ -56,7 +55,7 @@ def eval_model(args):
         prompt = result['prompt']
         input_ids = input_ids.unsqueeze(0).cuda()
 
-        image = Image.open(os.path.join(args.image_folder, image_file)).convert('RGB')
+        image = open_image(os.path.join(args.image_folder, image_file), image_processor.decode_size)
         image_tensor = image_processor(image)
         image_tensors = image_tensor.unsqueeze(0).half().cuda()
         image_sizes = [image.size]
@@ -10,7 +10,6 @@ from tinyllava.utils import *
 from tinyllava.data import *
 from tinyllava.model import *
 
-from PIL import Image
 import math
 
 
@@ -30,7 +29,7 @@ def eval_model(args):
     disable_torch_init()
     model_path = os.path.expanduser(args.model_path)
     
-    model, tokenizer, image_processor, context_len = load_pretrained_model(model_path)
+    model, tokenizer, image_processor, context_len = load_pretrained_model(model_path, image_token_reduction=args.image_token_reduction)
     model.to(device='cuda')    
     text_processor = TextPreprocess(tokenizer, args.conv_mode)
     data_args = model.config
@@ -47,11 +46,10 @@ def eval_model(args):
     for batch_start in tqdm(range(0, len(questions), batch_size)):
         batch = questions[batch_start:batch_start+batch_size]
 
-        input_ids_list = []
+        messages_list = []
         image_tensors_list = []
         image_sizes_list = []
         idx_list = []
-        prompt_list = []
 
         for line in batch:
             idx = line["question_id"]
@@ -63,28 +61,35 @@ def eval_model(args):
 
             msg = Message()
             msg.add_message(qs)
-
-            result = text_processor(msg.messages, mode='eval')
-            input_ids = result['input_ids']
-            prompt = result['prompt']
-            input_ids_list.append(input_ids)
-            prompt_list.append(prompt)
+            messages_list.append(msg.messages)
             idx_list.append(idx)
 
-            image = Image.open(os.path.join(args.image_folder, image_file)).convert('RGB')
-            image_tensor = image_processor(image)
-            image_tensors_list.append(image_tensor)
+            image = open_image(os.path.join(args.image_folder, image_file), image_processor.decode_size)
+            if args.batch_preprocess:
+                image_tensors_list.append(image)
+            else:
+                image_tensors_list.append(image_processor(image))
             image_sizes_list.append(image.size)
 
-        # Pad input_ids to the same length
+        results = text_processor.batch(messages_list, mode='eval')
+        input_ids_list = [result['input_ids'] for result in results]
+        prompt_list = [result['prompt'] for result in results]
+
+        # Pad input_ids to the same length, generate left pads the multimodal prompts using the attention mask
         input_ids_padded = pad_sequence(input_ids_list, batch_first=True, padding_value=tokenizer.pad_token_id)
         input_ids_padded = input_ids_padded.cuda()
+        lengths = torch.tensor([len(input_ids) for input_ids in input_ids_list], device=input_ids_padded.device)
+        attention_mask = torch.arange(input_ids_padded.shape[1], device=input_ids_padded.device)[None] < lengths[:, None]
 
-        image_tensors = torch.stack(image_tensors_list).half().cuda()
+        if args.batch_preprocess:
+            image_tensors = image_processor.batch(image_tensors_list, device='cuda').half()
+        else:
+            image_tensors = torch.stack(image_tensors_list).half().cuda()
 
         with torch.inference_mode():
             output_ids = model.generate(
                 input_ids_padded,
+                attention_mask=attention_mask,
                 images=image_tensors,
                 image_sizes=image_sizes_list,
                 do_sample=True if args.temperature > 0 else False,
@@ -117,6 +122,8 @@ if __name__ == "__main__":
     parser.add_argument("--conv-mode", type=str, default="llava_v1")
     parser.add_argument("--num-chunks", type=int, default=1)
     parser.add_argument("--chunk-idx", type=int, default=0)
+    parser.add_argument("--image-token-reduction", type=str, default=None, help="e.g. pool4 or merge2, for mlp connectors")
+    parser.add_argument("--batch-preprocess", action="store_true", help="resize and normalize each batch of images on the GPU")
     parser.add_argument("--temperature", type=float, default=0.2)
     parser.add_argument("--top_p", type=float, default=None)
     parser.add_argument("--num_beams", type=int, default=1)
@@ -13,7 +13,6 @@ from tinyllava.model import *
 
 from torch.utils.data import Dataset, DataLoader
 
-from PIL import Image
 import math
 
 
@@ -41,7 +40,7 @@ class CustomDataset(Dataset):
         image_file = line["image"]
         qs = line["text"]
 
-        image = Image.open(os.path.join(args.image_folder, image_file)).convert('RGB')
+        image = open_image(os.path.join(args.image_folder, image_file), self.image_processor.decode_size)
         image_tensor = self.image_processor(image)
         
         qs = DEFAULT_IMAGE_TOKEN + '\n' + qs
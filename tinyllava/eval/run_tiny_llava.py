@@ -1,7 +1,6 @@
 import argparse
 import re
 import requests
-from PIL import Image
 from io import BytesIO
 
 import torch
@@ -17,19 +16,19 @@ def image_parser(args):
     return out
 
 
-def load_image(image_file):
+def load_image(image_file, min_size=None):
     if image_file.startswith("http") or image_file.startswith("https"):
         response = requests.get(image_file)
-        image = Image.open(BytesIO(response.content)).convert("RGB")
+        image = open_image(BytesIO(response.content), min_size)
     else:
-        image = Image.open(image_file).convert("RGB")
+        image = open_image(image_file, min_size)
     return image
 
 
-def load_images(image_files):
+def load_images(image_files, min_size=None):
     out = []
     for image_file in image_files:
-        image = load_image(image_file)
+        image = load_image(image_file, min_size)
         out.append(image)
     return out
 
@@ -67,7 +66,7 @@ def eval_model(args):
         
 
     image_files = image_parser(args)
-    images = load_images(image_files)[0]
+    images = load_images(image_files, image_processor.decode_size)[0]
     images_tensor = image_processor(images)
     images_tensor = images_tensor.unsqueeze(0).half().cuda()
 
@@ -2,6 +2,11 @@ from .llm import *
 from .connector import *
 from .vision_tower import *
 from .configuration_tinyllava import *
+from .static_generation import *
+from .speculative_generation import *
+from .prompt_lookup import *
 from .modeling_tinyllava import *
 from .convert_legecy_weights_to_tinyllavafactory import *
 from .load_model import *
+from .multi_lora import *
+from .quantization import *
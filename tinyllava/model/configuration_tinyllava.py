@@ -32,7 +32,7 @@ class TinyLlavaConfig(PretrainedConfig):
         num_resampler_layers = None,
         use_cache = False,
         cache_dir = None,
-        tokenizer_use_fast = False,
+        tokenizer_use_fast = True,
         tune_type_llm = 'frozen',
         tune_type_connector = 'frozen',
         tune_type_vision_tower = 'frozen',
@@ -85,7 +85,7 @@ class TinyLlavaConfig(PretrainedConfig):
         self.num_resampler_layers = getattr(config, 'num_resampler_layers',  None)
         
         self.cache_dir = getattr(config, 'cache_dir', None)
-        self.tokenizer_use_fast = getattr(config, 'tokenizer_use_fast', False)
+        self.tokenizer_use_fast = getattr(config, 'tokenizer_use_fast', True)
         self.tokenizer_model_max_length = getattr(config, 'model_max_length', 2048)
         self.tokenizer_padding_side = getattr(config, 'tokenizer_padding_side', 'right')
         
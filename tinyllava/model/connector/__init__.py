@@ -7,7 +7,8 @@ CONNECTOR_FACTORY = {}
 
 def ConnectorFactory(connector_name):
     model = None
-    for name in CONNECTOR_FACTORY.keys():
+    # the longest registered name wins, e.g. mof_mlp over mlp
+    for name in sorted(CONNECTOR_FACTORY.keys(), key=len):
         if name.lower() in connector_name.lower():
             model = CONNECTOR_FACTORY[name]
     assert model, f"{connector_name} is not registered"
@@ -1,8 +1,7 @@
-import os
-
-import torch
 import torch.nn as nn
 
+from ...utils.checkpoint_utils import load_component_state_dict
+
 
 class Connector(nn.Module):
     def __init__(self, config=None):
@@ -12,8 +11,7 @@ class Connector(nn.Module):
     def load_model(self, **kwargs):
         pretrained_connector_path = kwargs.get('pretrained_connector_path', None)
         if pretrained_connector_path is not None:
-            pretrained_connector_path = os.path.join(pretrained_connector_path, 'pytorch_model.bin')
-            connector_weights = torch.load(pretrained_connector_path, map_location='cpu')
+            connector_weights = load_component_state_dict(pretrained_connector_path)
             def get_w(weights, keyword):
                 return {k.split(keyword + '.')[1]: v for k, v in weights.items() if keyword in k}
             self._connector.load_state_dict(get_w(connector_weights, '_connector'))
@@ -19,8 +19,8 @@ class MLPConnector(Connector):
     def __init__(self, config):
         super().__init__()
         
-        mlp_gelu_match = re.match(r'^mlp(\d+)x_gelu$', config.connector_type)
-        act_type = config.connector_type.split('_')[-1]
+        mlp_gelu_match = re.match(r'^mlp(\d+)x_(gelu)', config.connector_type)
+        act_type = mlp_gelu_match.group(2)
         mlp_depth = int(mlp_gelu_match.group(1))
         modules = [nn.Linear(config.vision_hidden_size, config.hidden_size)]
         for _ in range(1, mlp_depth):
@@ -31,11 +31,16 @@ class MoFMLP(nn.Module):
         image_features_clip = self.clip(x[0])
         image_features_dinov2 = self.dinov2(x[1])
 
+        if image_features_clip.shape == image_features_dinov2.shape:
+            # interleave clip and dinov2 tokens on the device of the features
+            merged_features = torch.stack([image_features_clip, image_features_dinov2], dim=2).flatten(1, 2)
+            return merged_features.to(dtype=x[0].dtype)
+
         bs = image_features_clip.size(0)
         total_len = image_features_clip.size(1)+image_features_dinov2.size(1)
         dim = image_features_clip.size(-1)
 
-        merged_features = torch.empty(bs, total_len, dim).to(device=x[0].device, dtype=x[0].dtype)
+        merged_features = torch.empty(bs, total_len, dim, device=x[0].device, dtype=x[0].dtype)
         merged_features[:,0::2] = image_features_clip
         merged_features[:,1::2] = image_features_dinov2
 
@@ -1,11 +1,9 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
+
 from . import register_connector
 from .base import Connector
-import torch
-from einops import rearrange, repeat
-from einops_exts import rearrange_many
-from torch import einsum
 
 
 
@@ -31,15 +29,13 @@ class PerceiverResampler(nn.Module):
         self.norm = nn.LayerNorm(dim)
 
     def forward(self, x):
-        b, v = x.shape[:2]
         x = self.linear(x)
         # blocks
-        latents = repeat(self.latents, "n d -> b T n d", b=b, T=1)
-        x = x.unsqueeze(1)
+        latents = self.latents.to(x.dtype).expand(x.shape[0], -1, -1)
         for attn, ff in self.layers:
             latents = attn(x, latents) + latents
             latents = ff(latents) + latents
-        return self.norm(latents).squeeze(1)
+        return self.norm(latents)
 
     
 @register_connector('resampler')    
@@ -70,6 +66,7 @@ class PerceiverAttention(nn.Module):
         super().__init__()
         self.scale = dim_head**-0.5
         self.heads = heads
+        self.dim_head = dim_head
         inner_dim = dim_head * heads
 
         self.norm_media = nn.LayerNorm(dim)
@@ -83,27 +80,23 @@ class PerceiverAttention(nn.Module):
         """
         Args:
             x (torch.Tensor): image features
-                shape (b, T, n1, D)
+                shape (b, n1, D)
             latent (torch.Tensor): latent features
-                shape (b, T, n2, D)
+                shape (b, n2, D)
         """
         x = self.norm_media(x)
         latents = self.norm_latents(latents)
 
-        h = self.heads
-
+        b, n = latents.shape[:2]
         q = self.to_q(latents)
+        # keys and values of the media and the latents come out of a single projection
         kv_input = torch.cat((x, latents), dim=-2)
-        k, v = self.to_kv(kv_input).chunk(2, dim=-1)
-        q, k, v = rearrange_many((q, k, v), "b t n (h d) -> b h t n d", h=h)
-        q = q * self.scale
-
-        # attention
-        sim = einsum("... i d, ... j d  -> ... i j", q, k)
-        sim = sim - sim.amax(dim=-1, keepdim=True).detach()
-        attn = sim.softmax(dim=-1)
+        kv = self.to_kv(kv_input).view(b, -1, 2, self.heads, self.dim_head)
+        k, v = kv.permute(2, 0, 3, 1, 4).unbind(0)
+        q = q.view(b, n, self.heads, self.dim_head).transpose(1, 2)
 
-        out = einsum("... i j, ... j d -> ... i d", attn, v)
-        out = rearrange(out, "b h t n d -> b t n (h d)", h=h)
+        # fused attention, dispatched to the flash or memory efficient kernels when available
+        out = F.scaled_dot_product_attention(q, k, v)
+        out = out.transpose(1, 2).reshape(b, n, -1)
         return self.to_out(out)
     
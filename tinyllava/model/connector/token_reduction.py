@@ -0,0 +1,80 @@
+import math
+import re
+
+import torch
+import torch.nn.functional as F
+
+from . import register_connector
+from .mlp import MLPConnector
+
+
+def pool_tokens(x, factor):
+    """
+    Average pool the patch tokens x [b, n, d] on their square grid, with a 1 x factor window, or a
+    sqrt(factor) x sqrt(factor) window when factor is a perfect square. A leading cls token is kept.
+    """
+    n = x.shape[1]
+    num_prefix = 0 if math.isqrt(n) ** 2 == n else 1
+    side = math.isqrt(n - num_prefix)
+    assert side * side == n - num_prefix, f'{n} image tokens do not form a square grid'
+    stride = math.isqrt(factor)
+    kernel_size = (stride, stride) if stride * stride == factor else (1, factor)
+    grid = x[:, num_prefix:].transpose(1, 2).unflatten(2, (side, side))
+    grid = F.avg_pool2d(grid, kernel_size, ceil_mode=True)
+    return torch.cat([x[:, :num_prefix], grid.flatten(2).transpose(1, 2)], dim=1)
+
+
+def merge_tokens(x, num_tokens):
+    """
+    Bipartite soft matching (ToMe): repeatedly split the tokens x [b, n, d] into alternating sets A and B
+    and average the most similar A tokens into their closest B token, until num_tokens are left.
+    Merged tokens are weighted by the number of patches they cover and keep the spatial order.
+    """
+    b, n, d = x.shape
+    size = x.new_ones(b, n, 1)
+    position = torch.arange(n, device=x.device).expand(b, -1)
+
+    def gather(t, index):
+        return t.gather(1, index[..., None].expand(-1, -1, t.shape[-1]))
+
+    while x.shape[1] > num_tokens:
+        r = min(x.shape[1] - num_tokens, x.shape[1] // 2)
+        x_a, x_b = x[:, ::2], x[:, 1::2]
+        scores = F.normalize(x_a, dim=-1) @ F.normalize(x_b, dim=-1).transpose(1, 2)
+        node_max, node_index = scores.max(dim=-1)
+        edge_index = node_max.argsort(dim=-1, descending=True)
+        src_index, unmerged_index = edge_index[:, :r], edge_index[:, r:]
+        dst_index = node_index.gather(1, src_index)
+
+        size_a, size_b = size[:, ::2], size[:, 1::2]
+        x_b = (x_b * size_b).scatter_add(1, dst_index[..., None].expand(-1, -1, d), gather(x_a * size_a, src_index))
+        size_b = size_b.scatter_add(1, dst_index[..., None], gather(size_a, src_index))
+        x = torch.cat([gather(x_a, unmerged_index), x_b / size_b], dim=1)
+        size = torch.cat([gather(size_a, unmerged_index), size_b], dim=1)
+        position = torch.cat([position[:, ::2].gather(1, unmerged_index), position[:, 1::2]], dim=1)
+
+    return gather(x, position.argsort(dim=1))
+
+
+@register_connector('pool')
+@register_connector('merge')
+class TokenReductionConnector(MLPConnector):
+    """
+    mlp connector followed by image token reduction, so that a trained mlp{depth}x_gelu checkpoint is
+    served with fewer image tokens. connector_type is the mlp type with a _pool{factor} or _merge{factor}
+    suffix, e.g. mlp2x_gelu_pool4 (2x2 average pooling) or mlp2x_gelu_merge2 (token merging to half).
+    """
+    def __init__(self, config):
+        super().__init__(config)
+        reduction_match = re.search(r'_(pool|merge)(\d+)$', config.connector_type)
+        assert reduction_match, f'{config.connector_type} does not end with _pool{{factor}} or _merge{{factor}}'
+        self.reduction = reduction_match.group(1)
+        self.factor = int(reduction_match.group(2))
+
+    def forward(self, x):
+        x = self._connector(x)
+        if self.factor <= 1:
+            return x
+        if self.reduction == 'pool':
+            return pool_tokens(x, self.factor)
+        return merge_tokens(x, math.ceil(x.shape[1] / self.factor))
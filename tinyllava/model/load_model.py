@@ -1,22 +1,207 @@
 import os
+import re
+import json
+import shutil
+import hashlib
 import torch
 from collections import OrderedDict
 from transformers import AutoTokenizer, AutoModelForCausalLM, AutoConfig, BitsAndBytesConfig
 
 from .modeling_tinyllava import TinyLlavaForConditionalGeneration
 from .configuration_tinyllava import TinyLlavaConfig
+from . import ConnectorFactory
+from .quantization import quantize_weight_only
+from ..utils.checkpoint_utils import load_component_state_dict
+
+MERGED_LORA_DIR = 'merged'
+MERGE_INFO_NAME = 'merge_info.json'
  
-def load_base_ckp_for_lora(ckp_path):
-    ckp = torch.load(ckp_path, map_location=torch.device('cpu'))
+def load_base_ckp_for_lora(ckp_path, dtype=None):
+    if os.path.isdir(ckp_path):
+        ckp = load_component_state_dict(ckp_path, dtype=dtype)
+    else:
+        ckp = torch.load(ckp_path, map_location=torch.device('cpu'))
     new_ckp = OrderedDict()
     for k, v in ckp.items():
         new_k = k.replace('.base_layer', '')
         new_ckp[new_k] = v
     return new_ckp
+
+
+def load_state_dict_into_empty(module, state_dict, dtype=None, strict=True):
+    """
+    Load a checkpoint into a module built by TinyLlavaForConditionalGeneration.from_empty_weights,
+    assigning the checkpoint tensors (cast to dtype) instead of copying into initialized ones.
+    """
+    from accelerate.utils import set_module_tensor_to_device
+    names = set(n for n, _ in module.named_parameters()) | set(n for n, _ in module.named_buffers())
+    unexpected = [k for k in state_dict.keys() if k not in names]
+    if strict and len(unexpected) > 0:
+        raise RuntimeError(f'Unexpected keys in checkpoint: {unexpected}')
+    for k, v in state_dict.items():
+        if k in names:
+            set_module_tensor_to_device(module, k, 'cpu', value=v, dtype=dtype)
+
+
+def check_no_empty_weights(model):
+    tensors = list(model.named_parameters()) + list(model.named_buffers())
+    missing = [n for n, t in tensors if t.device.type == 'meta']
+    if len(missing) > 0:
+        raise RuntimeError(f'Parameters or buffers missing from the checkpoints: {missing}')
+    
+
+def load_lora_base_model(model_name_or_path):
+    model_config = TinyLlavaConfig.from_pretrained(model_name_or_path)
+    model = TinyLlavaForConditionalGeneration.from_empty_weights(model_config)
+    language_model_ckp_path = os.path.join(model_name_or_path, 'language_model')
+    language_model_ckp = load_base_ckp_for_lora(language_model_ckp_path, dtype=torch.float16)
+    load_state_dict_into_empty(model.language_model, language_model_ckp, dtype=torch.float16)
+    vision_tower_ckp_path = os.path.join(model_name_or_path, 'vision_tower')
+    vision_tower_ckp = load_base_ckp_for_lora(vision_tower_ckp_path, dtype=torch.float16)
+    load_state_dict_into_empty(model.vision_tower._vision_tower, vision_tower_ckp, dtype=torch.float16)
+    connector_ckp_path = os.path.join(model_name_or_path, 'connector')
+    connector_ckp = load_base_ckp_for_lora(connector_ckp_path, dtype=torch.float16)
+    load_state_dict_into_empty(model.connector, connector_ckp, dtype=torch.float16, strict=False)
+    model.tie_weights()
+    check_no_empty_weights(model)
+    model.to(torch.float16)
+    return model
+
+
+def load_lora_model(model_name_or_path):
+    model = load_lora_base_model(model_name_or_path)
+    from peft import PeftModel
+    print('Loading LoRA weights...')
+    model = PeftModel.from_pretrained(model, model_name_or_path)
+    print('Merging LoRA weights...')
+    model = model.merge_and_unload()
+    return model
+
+
+def get_lora_checkpoint_files(model_name_or_path):
+    files = [f for f in ['config.json', 'adapter_config.json', 'adapter_model.safetensors', 'adapter_model.bin']
+             if os.path.exists(os.path.join(model_name_or_path, f))]
+    for component in ['language_model', 'vision_tower', 'connector']:
+        component_dir = os.path.join(model_name_or_path, component)
+        files += sorted(os.path.join(component, f) for f in os.listdir(component_dir)
+                        if f.endswith(('.safetensors', '.bin', '.json')))
+    return files
+
+
+def get_lora_checkpoint_fingerprint(model_name_or_path):
+    fingerprint = []
+    for f in get_lora_checkpoint_files(model_name_or_path):
+        stat = os.stat(os.path.join(model_name_or_path, f))
+        fingerprint.append([f, stat.st_size, stat.st_mtime_ns])
+    return fingerprint
+
+
+def get_lora_checkpoint_hash(model_name_or_path):
+    """
+    sha256 over the contents of the base component checkpoints, the adapter and the configs of a LoRA run.
+    """
+    sha = hashlib.sha256()
+    for f in get_lora_checkpoint_files(model_name_or_path):
+        sha.update(f.encode())
+        with open(os.path.join(model_name_or_path, f), 'rb') as fp:
+            for chunk in iter(lambda: fp.read(1 << 24), b''):
+                sha.update(chunk)
+    return sha.hexdigest()
+
+
+def get_merged_lora_path(model_name_or_path):
+    """
+    Return the merged checkpoint written by save_merged_lora_model if it was built from the current
+    base and adapter weights, else None. The content hash is only recomputed when the size or mtime
+    of a source file changed since the merge, a matching hash updates the recorded sizes and mtimes.
+    """
+    merged_path = os.path.join(model_name_or_path, MERGED_LORA_DIR)
+    info_path = os.path.join(merged_path, MERGE_INFO_NAME)
+    if not os.path.exists(info_path):
+        return None
+    with open(info_path, 'r') as f:
+        merge_info = json.load(f)
+    if merge_info['fingerprint'] == get_lora_checkpoint_fingerprint(model_name_or_path):
+        return merged_path
+    if merge_info['hash'] == get_lora_checkpoint_hash(model_name_or_path):
+        # same contents with new mtimes (e.g. a copied checkpoint): record them so the next load skips the hash
+        merge_info['fingerprint'] = get_lora_checkpoint_fingerprint(model_name_or_path)
+        tmp_path = f'{info_path}.tmp{os.getpid()}'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(merge_info, f, indent=2)
+            os.replace(tmp_path, info_path)
+        except OSError as e:
+            print(f'Could not update {info_path}: {e}')
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return merged_path
+    print(f'Ignoring stale merged LoRA model in {merged_path}')
+    return None
+
+
+def save_merged_lora_model(model, model_name_or_path):
+    """
+    Write a merged LoRA model to the merged directory of its source checkpoint, so later loads skip the merge.
+    The checkpoint is written to a temporary directory and renamed, concurrent writers keep the first one.
+    An existing merged directory is never replaced, even a stale one, as other processes may be loading it.
+    """
+    merged_path = os.path.join(model_name_or_path, MERGED_LORA_DIR)
+    tmp_path = f'{merged_path}.tmp{os.getpid()}'
+    try:
+        merge_info = {
+            'source': os.path.abspath(model_name_or_path),
+            'hash': get_lora_checkpoint_hash(model_name_or_path),
+            'fingerprint': get_lora_checkpoint_fingerprint(model_name_or_path),
+        }
+        model.save_pretrained(tmp_path, safe_serialization=True)
+        with open(os.path.join(tmp_path, MERGE_INFO_NAME), 'w') as f:
+            json.dump(merge_info, f, indent=2)
+        os.rename(tmp_path, merged_path)
+        print(f'Saved merged LoRA model to {merged_path}')
+    except OSError as e:
+        print(f'Could not save merged LoRA model to {merged_path}: {e}')
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return merged_path
+
+
+def merge_lora_checkpoint(model_name_or_path, force=False):
+    """
+    Merge a LoRA run into its merged directory, force first removes a stale merged directory.
+    """
+    merged_path = os.path.join(model_name_or_path, MERGED_LORA_DIR)
+    if get_merged_lora_path(model_name_or_path) is not None:
+        print(f'{merged_path} is up to date')
+        return merged_path
+    if os.path.exists(merged_path):
+        if not force:
+            print(f'{merged_path} is stale, pass force to replace it')
+            return None
+        shutil.rmtree(merged_path)
+    model = load_lora_model(model_name_or_path)
+    return save_merged_lora_model(model, model_name_or_path)
     
 
+def set_image_token_reduction(model, image_token_reduction):
+    """
+    Swap the mlp connector of a loaded model for the token reduction connector around the same mlp
+    module, image_token_reduction is e.g. 'pool4' (2x2 average pooling) or 'merge2' (token merging to half),
+    None restores the plain mlp connector. The mlp layers are reused as they are, also once quantized.
+    """
+    connector_type = re.sub(r'_(pool|merge)\d+$', '', model.config.connector_type)
+    assert connector_type.startswith('mlp'), f'Image token reduction needs an mlp connector, got {connector_type}'
+    if image_token_reduction is not None:
+        connector_type = f'{connector_type}_{image_token_reduction}'
+    model.config.connector_type = connector_type
+    connector = ConnectorFactory(connector_type)(model.config)
+    connector._connector = model.connector._connector
+    model.connector = connector
+    return model
+
+
 def load_pretrained_model(model_name_or_path, load_type='hf', load_8bit=False, load_4bit=False, device_map="auto",
-                          device="cuda", **kwargs):
+                          device="cuda", cache_merged_lora=True, cpu_quantization=None,
+                          image_token_reduction=None, **kwargs):
     kwargs = {"device_map": device_map, **kwargs}
     if device != "cuda":
         kwargs['device_map'] = {"": device}
@@ -38,24 +223,30 @@ def load_pretrained_model(model_name_or_path, load_type='hf', load_8bit=False, l
         
     elif model_name_or_path is not None and 'lora' in model_name_or_path:
         if os.path.exists(os.path.join(model_name_or_path, 'adapter_config.json')):
-            model_config = TinyLlavaConfig.from_pretrained(model_name_or_path)
-            model = TinyLlavaForConditionalGeneration(model_config)
-            language_model_ckp_path = os.path.join(model_name_or_path, 'language_model/pytorch_model.bin')
-            language_model_ckp = load_base_ckp_for_lora(language_model_ckp_path)
-            model.language_model.load_state_dict(language_model_ckp)
-            vision_tower_ckp_path = os.path.join(model_name_or_path, 'vision_tower/pytorch_model.bin')
-            vision_tower_ckp = load_base_ckp_for_lora(vision_tower_ckp_path)
-            model.vision_tower._vision_tower.load_state_dict(vision_tower_ckp)
-            connector_ckp_path = os.path.join(model_name_or_path, 'connector/pytorch_model.bin')
-            connector_ckp = load_base_ckp_for_lora(connector_ckp_path)
-            model.connector.load_state_dict(connector_ckp, strict=False)
-            model.to(torch.float16)
-            from peft import PeftModel
-            print('Loading LoRA weights...')
-            model = PeftModel.from_pretrained(model, model_name_or_path)
-            print('Merging LoRA weights...')
-            model = model.merge_and_unload()
+            merged_path = get_merged_lora_path(model_name_or_path)
+            if merged_path is not None:
+                print(f'Loading merged LoRA model from {merged_path}...')
+                model = TinyLlavaForConditionalGeneration.from_pretrained(merged_path,low_cpu_mem_usage=True,torch_dtype=torch.float16)
+            else:
+                model = load_lora_model(model_name_or_path)
+                if cache_merged_lora:
+                    save_merged_lora_model(model, model_name_or_path)
             print('Model is loaded...')
+        else:
+            model = TinyLlavaForConditionalGeneration.from_pretrained(model_name_or_path,low_cpu_mem_usage=True,torch_dtype=torch.float16)
+
+    if image_token_reduction is not None:
+        set_image_token_reduction(model, image_token_reduction)
+
+    if device == 'cpu':
+        # fp16 kernels are slow or missing on CPU: run fp32, or bf16 activations with cpu_quantization,
+        # int8 / int4 weights dequantize in every forward and only save memory over bf16
+        if cpu_quantization is None:
+            model.to(torch.float32)
+        elif cpu_quantization == 'bf16':
+            model.to(torch.bfloat16)
+        else:
+            quantize_weight_only(model, bits={'int8': 8, 'int4': 4}[cpu_quantization], dtype=torch.bfloat16)
         
     image_processor = model.vision_tower._image_processor
     context_len = getattr(model.config, 'max_sequence_length', 2048)
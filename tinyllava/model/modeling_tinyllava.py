@@ -6,12 +6,16 @@ import torch
 import torch.utils.checkpoint
 from torch import nn
 
+from accelerate import init_empty_weights
 from transformers import PreTrainedModel
+from transformers.modeling_utils import no_init_weights
 from transformers.modeling_outputs import CausalLMOutputWithPast
 from transformers.generation.utils import GenerateOutput
 
 from . import LLMFactory, ConnectorFactory, VisionTowerFactory
 from .configuration_tinyllava import TinyLlavaConfig
+from .static_generation import StaticCacheGenerator
+from .speculative_generation import SpeculativeGenerator, DraftModelDrafter
 from ..utils.constants import *
 # from tinyllava.utils.data_utils import get_value_from_kwargs
 
@@ -64,16 +68,39 @@ class TinyLlavaForConditionalGeneration(TinyLlavaPreTrainedModel):
         self.vision_tower = VisionTowerFactory(config.vision_model_name_or_path)(config.vision_config)
         self.connector = ConnectorFactory(config.connector_type)(config)
 
-        (Tokenizer, post_load) = LLMFactory(config.llm_model_name_or_path)[1]
-        self.tokenizer = post_load(Tokenizer.from_pretrained(
-            config.tokenizer_name_or_path,
-            cache_dir = config.cache_dir,
-            model_max_length = config.tokenizer_model_max_length,
-            padding_side = config.tokenizer_padding_side,
-            use_fast = config.tokenizer_use_fast,
-        ))
+        # the tokenizer is loaded on first access, see the tokenizer property
+        self._tokenizer = None
+        # set by enable_static_generation and enable_speculative_generation
+        self._static_generator = None
+        self._speculative_generator = None
         self.post_init()
 
+    @classmethod
+    def from_empty_weights(cls, config: TinyLlavaConfig):
+        """
+        Build the model with parameters on the meta device and without weight initialization,
+        for callers that load every weight from checkpoints afterwards (see load_model.py).
+        """
+        with init_empty_weights(), no_init_weights():
+            return cls(config)
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            (Tokenizer, post_load) = LLMFactory(self.config.llm_model_name_or_path)[1]
+            self._tokenizer = post_load(Tokenizer.from_pretrained(
+                self.config.tokenizer_name_or_path,
+                cache_dir = self.config.cache_dir,
+                model_max_length = self.config.tokenizer_model_max_length,
+                padding_side = self.config.tokenizer_padding_side,
+                use_fast = self.config.tokenizer_use_fast,
+            ))
+        return self._tokenizer
+
+    @tokenizer.setter
+    def tokenizer(self, tokenizer):
+        self._tokenizer = tokenizer
+
     
     def get_input_embeddings(self):
         return self.language_model.get_input_embeddings()
@@ -159,37 +186,114 @@ class TinyLlavaForConditionalGeneration(TinyLlavaPreTrainedModel):
         image_sizes: Optional[torch.Tensor] = None,
         **kwargs,
     ) -> Union[GenerateOutput, torch.LongTensor]:
-        position_ids = kwargs.pop("position_ids", None)
+        # position ids follow the left padding of the attention mask, the language model generate
+        # derives them from it at every step
+        if "position_ids" in kwargs:
+            raise ValueError("`position_ids` is not supported, they are derived from the attention mask")
         attention_mask = kwargs.pop("attention_mask", None)
         if "inputs_embeds" in kwargs:
             raise NotImplementedError("`inputs_embeds` is not supported")
 
-        if images is not None:
-            (
-                inputs,
-                position_ids,
-                attention_mask,
-                _,
-                inputs_embeds,
-                _
-            ) = self.prepare_inputs_labels_for_multimodal(
-                inputs,
-                position_ids,
-                attention_mask,
-                None,
-                None,
-                images,
-                image_sizes=image_sizes
-            )
-        else:
-            inputs_embeds = self.language_model.get_input_embeddings()(inputs)
+        input_ids = inputs
+        inputs_embeds, attention_mask = self.prepare_inputs_for_multimodal_generation(
+            input_ids, attention_mask, images, image_sizes)
+
+        speculative_generator = self._speculative_generator
+        if speculative_generator is not None and speculative_generator.can_generate(inputs_embeds, kwargs) \
+                and attention_mask.all():
+            return speculative_generator.generate(inputs_embeds, input_ids, images, image_sizes, **kwargs)
 
+        if self._static_generator is not None:
+            if self._static_generator.can_generate(inputs_embeds, kwargs) and attention_mask.all():
+                return self._static_generator.generate(inputs_embeds, **kwargs)
+            # the layers would otherwise use the static cache of the wrong size
+            self._static_generator.reset_cache()
         return self.language_model.generate(
-            position_ids=position_ids,
             attention_mask=attention_mask,
             inputs_embeds=inputs_embeds,
             **kwargs
         )
+
+    def enable_static_generation(self, batch_size=1, compile=True, warmup=True):
+        """
+        Generate with a preallocated KV cache and a compiled decode step, see StaticCacheGenerator.
+        Call after the model is moved to its device.
+        """
+        if not StaticCacheGenerator.is_supported(self.language_model):
+            print(f'{type(self.language_model).__name__} does not support a static KV cache, using the dynamic cache')
+            return False
+        self._static_generator = StaticCacheGenerator(self, batch_size, compile)
+        if warmup:
+            print('Warming up the static cache decode step...')
+            self._static_generator.warmup()
+        return True
+
+    def disable_static_generation(self):
+        if self._static_generator is not None:
+            self._static_generator.reset_cache()
+            self._static_generator = None
+
+    def enable_speculative_generation(self, drafter, num_draft_tokens=5):
+        """
+        Generate with speculative decoding, see SpeculativeGenerator. drafter is a smaller
+        TinyLlavaForConditionalGeneration with the same vision tower and tokenizer, or a drafter
+        such as PromptLookupDrafter.
+        """
+        # the draft and verify forwards use the dynamic cache
+        self.disable_static_generation()
+        if isinstance(drafter, TinyLlavaForConditionalGeneration):
+            drafter = DraftModelDrafter(self, drafter)
+        self._speculative_generator = SpeculativeGenerator(self, drafter, num_draft_tokens)
+        return self._speculative_generator
+
+    def disable_speculative_generation(self):
+        self._speculative_generator = None
+
+    def get_inputs_embeds(self, input_ids, images=None, image_sizes=None):
+        return self.prepare_inputs_for_multimodal_generation(input_ids, None, images, image_sizes)[0]
+
+    def prepare_inputs_for_multimodal_generation(self, input_ids, attention_mask=None, images=None, image_sizes=None):
+        """
+        Left padded inputs_embeds and attention mask of a batch of prompts of different lengths, for
+        generation. attention_mask marks the padding of input_ids on either side, the images are
+        encoded once per prompt, beams expand the embeddings afterwards. Prompts longer than
+        tokenizer_model_max_length are truncated on the left, keeping the end of the conversation.
+        """
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids, dtype=torch.bool)
+        image_features = self.encode_images(images) if images is not None else None
+        embed_tokens = self.language_model.get_input_embeddings()
+
+        new_input_embeds = []
+        cur_image_idx = 0
+        for cur_input_ids, cur_attention_mask in zip(input_ids, attention_mask.bool()):
+            cur_input_ids = cur_input_ids[cur_attention_mask]
+            image_token_indices = torch.where(cur_input_ids == IMAGE_TOKEN_INDEX)[0].tolist()
+            # image placeholders are embedded as token 0 and replaced by the image features
+            cur_input_embeds = embed_tokens(cur_input_ids.clamp(min=0))
+            if image_features is not None and len(image_token_indices) == 0:
+                # as in training, a prompt without image token still owns an image
+                cur_image_idx += 1
+            chunks, start = [], 0
+            for index in image_token_indices:
+                chunks.append(cur_input_embeds[start:index])
+                chunks.append(image_features[cur_image_idx].to(cur_input_embeds.dtype))
+                cur_image_idx += 1
+                start = index + 1
+            chunks.append(cur_input_embeds[start:])
+            new_input_embeds.append(torch.cat(chunks))
+
+        tokenizer_model_max_length = getattr(self.config, 'tokenizer_model_max_length', None)
+        if tokenizer_model_max_length is not None:
+            new_input_embeds = [x[-tokenizer_model_max_length:] for x in new_input_embeds]
+
+        max_len = max(x.shape[0] for x in new_input_embeds)
+        inputs_embeds = new_input_embeds[0].new_zeros(len(new_input_embeds), max_len, new_input_embeds[0].shape[-1])
+        attention_mask = torch.zeros(len(new_input_embeds), max_len, dtype=torch.long, device=inputs_embeds.device)
+        for i, cur_input_embeds in enumerate(new_input_embeds):
+            inputs_embeds[i, max_len - cur_input_embeds.shape[0]:] = cur_input_embeds
+            attention_mask[i, max_len - cur_input_embeds.shape[0]:] = 1
+        return inputs_embeds, attention_mask
         
     def encode_images(self, images):
         kwargs = {}
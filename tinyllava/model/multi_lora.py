@@ -0,0 +1,104 @@
+import os
+import threading
+from collections import OrderedDict
+
+import torch
+
+from . import ConnectorFactory
+from .load_model import load_lora_base_model, load_base_ckp_for_lora
+
+
+class MultiLoRAModel:
+    """
+    Serve several LoRA adapters trained on the same base with one resident TinyLlavaForConditionalGeneration.
+    Adapters are loaded unmerged on first use and the least recently used one is unloaded once more than
+    max_loaded_adapters are resident. The language model and vision tower base weights are taken from
+    base_model_path, adapters must have been trained with those components frozen or tuned with LoRA.
+    Every adapter run keeps its own connector module, with the connector LoRA layers of the adapter if it
+    tuned the connector with LoRA, and set_adapter plugs it into the model.
+    Selecting an adapter and generating with it hold a lock, so concurrent requests are serialized.
+
+    Usage:
+        server = MultiLoRAModel(base_path, {'report': report_path, 'vqa': vqa_path})
+        output_ids = server.generate('vqa', inputs=input_ids, images=images)
+    """
+    def __init__(self, base_model_path, adapters=None, max_loaded_adapters=4, device='cuda'):
+        assert max_loaded_adapters >= 1, 'max_loaded_adapters must be at least 1'
+        self.model = load_lora_base_model(base_model_path).to(device)
+        self.model.eval()
+        self.device = device
+        self.max_loaded_adapters = max_loaded_adapters
+        self.adapter_paths = {}
+        self.peft_model = None
+        # adapter name -> connector module of its run, in least recently used order
+        self.loaded_adapters = OrderedDict()
+        self.active_adapter = None
+        self.lock = threading.RLock()
+        for name, path in (adapters or {}).items():
+            self.register_adapter(name, path)
+
+    @property
+    def tokenizer(self):
+        return self.model.tokenizer
+
+    def register_adapter(self, name, path):
+        if not os.path.exists(os.path.join(path, 'adapter_config.json')):
+            raise ValueError(f'{path} is not a LoRA checkpoint')
+        self.adapter_paths[name] = path
+
+    def _build_connector(self, path):
+        connector = ConnectorFactory(self.model.config.connector_type)(self.model.config)
+        connector.load_state_dict(load_base_ckp_for_lora(os.path.join(path, 'connector'), dtype=torch.float16))
+        return connector.to(device=self.device, dtype=torch.float16).eval()
+
+    def _load_adapter(self, name):
+        if name in self.loaded_adapters:
+            self.loaded_adapters.move_to_end(name)
+            return
+        if name not in self.adapter_paths:
+            raise KeyError(f'Unknown adapter {name}, registered adapters: {list(self.adapter_paths)}')
+        path = self.adapter_paths[name]
+        print(f'Loading LoRA adapter {name} from {path}...')
+        # the connector LoRA layers of the adapter, if any, are injected into its own connector
+        self.model.connector = self._build_connector(path)
+        self.active_adapter = None
+        if self.peft_model is None:
+            from peft import PeftModel
+            self.peft_model = PeftModel.from_pretrained(self.model, path, adapter_name=name)
+        else:
+            self.peft_model.load_adapter(path, adapter_name=name)
+        self.peft_model.to(self.device)
+        self.loaded_adapters[name] = self.model.connector
+        while len(self.loaded_adapters) > self.max_loaded_adapters:
+            evicted, _ = self.loaded_adapters.popitem(last=False)
+            print(f'Unloading LoRA adapter {evicted}...')
+            self.peft_model.base_model.delete_adapter(evicted)
+
+    def set_adapter(self, name):
+        with self.lock:
+            self._load_adapter(name)
+            if self.active_adapter != name:
+                # plugged in first, so that set_adapter also activates the connector LoRA layers
+                self.model.connector = self.loaded_adapters[name]
+                self.peft_model.set_adapter(name)
+                self.active_adapter = name
+            return self.model
+
+    @torch.inference_mode()
+    def generate(self, adapter_name, **kwargs):
+        # LoRA layers are injected in place, so the wrapped model runs with the active adapter,
+        # which must not change before the generation is done
+        with self.lock:
+            return self.set_adapter(adapter_name).generate(**kwargs)
+
+    def generate_batches(self, requests):
+        """
+        Run a list of (adapter_name, generate kwargs) requests, grouped by adapter so that every
+        adapter is selected once, and return the outputs in request order.
+        """
+        outputs = [None] * len(requests)
+        order = sorted(range(len(requests)), key=lambda i: (requests[i][0] != self.active_adapter, requests[i][0]))
+        for i in order:
+            adapter_name, kwargs = requests[i]
+            outputs[i] = self.generate(adapter_name, **kwargs)
+        return outputs
@@ -0,0 +1,97 @@
+import json
+from collections import Counter
+
+
+def find_continuation(context, ngram_size, num_tokens):
+    """
+    Tokens following the latest earlier occurrence of the last ngram_size tokens of context.
+    """
+    ngram = context[-ngram_size:]
+    for start in range(len(context) - ngram_size - 1, -1, -1):
+        if context[start:start + ngram_size] == ngram:
+            return context[start + ngram_size:start + ngram_size + num_tokens]
+    return []
+
+
+class PhraseBank:
+    """
+    Most frequent next token of every ngram_size tokens in the training reports, drafts standard
+    phrasing (section headers, normal study boilerplate) by chaining lookups.
+    """
+    def __init__(self, ngram_size=3, table=None):
+        self.ngram_size = ngram_size
+        self.table = table or {}
+
+    @classmethod
+    def from_reports(cls, reports, tokenizer, ngram_size=3, min_count=2):
+        counts = Counter()
+        for ids in tokenizer(reports, add_special_tokens=False)['input_ids']:
+            for i in range(len(ids) - ngram_size):
+                counts[tuple(ids[i:i + ngram_size + 1])] += 1
+        table, best = {}, {}
+        for gram, count in counts.items():
+            key = gram[:-1]
+            if count >= min_count and count > best.get(key, 0):
+                best[key] = count
+                table[key] = gram[-1]
+        return cls(ngram_size, table)
+
+    def propose(self, context, num_tokens):
+        context = list(context[-self.ngram_size:])
+        tokens = []
+        while len(tokens) < num_tokens:
+            next_token = self.table.get(tuple(context[-self.ngram_size:]))
+            if next_token is None:
+                break
+            tokens.append(next_token)
+            context.append(next_token)
+        return tokens
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'ngram_size': self.ngram_size, 'table': [list(k) + [v] for k, v in self.table.items()]}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            bank = json.load(f)
+        return cls(bank['ngram_size'], {tuple(row[:-1]): row[-1] for row in bank['table']})
+
+    def __len__(self):
+        return len(self.table)
+
+
+class PromptLookupDrafter:
+    """
+    Drafter for SpeculativeGenerator without a draft model: continues the longest n-gram (max_ngram_size
+    down to min_ngram_size) of the generated text found earlier in the prompt or the generated text,
+    and falls back to the phrase bank. Drafts are deterministic, the main model verifies them.
+    """
+    def __init__(self, phrase_bank=None, max_ngram_size=3, min_ngram_size=1):
+        self.phrase_bank = phrase_bank
+        self.max_ngram_size = max_ngram_size
+        self.min_ngram_size = min_ngram_size
+        self.prompt_ids = []
+
+    def prefill(self, input_ids, images=None, image_sizes=None):
+        # image placeholders have negative ids
+        self.prompt_ids = [t for t in input_ids[0].tolist() if t >= 0]
+
+    def propose(self, output_ids, num_tokens, do_sample=False, temperature=1.0, top_p=None):
+        if num_tokens == 0:
+            return [], None
+        context = self.prompt_ids + output_ids
+        for ngram_size in range(self.max_ngram_size, self.min_ngram_size - 1, -1):
+            if len(context) > ngram_size:
+                tokens = find_continuation(context, ngram_size, num_tokens)
+                if len(tokens) > 0:
+                    return tokens, None
+        if self.phrase_bank is not None:
+            return self.phrase_bank.propose(context, num_tokens), None
+        return [], None
+
+    def accept(self, num_previous, num_accepted):
+        pass
+
+    def release(self):
+        self.prompt_ids = []
@@ -0,0 +1,106 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+class WeightOnlyInt8Linear(nn.Module):
+    """
+    Linear layer with int8 weights and per output channel scales. Every forward converts the full
+    weight to the activation dtype (bf16 on CPU) before the matmul, so this saves weight memory
+    only and is not expected to decode faster than plain bf16.
+    """
+    def __init__(self, in_features, out_features, bias=True, dtype=torch.bfloat16):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.register_buffer('weight', torch.empty(out_features, in_features, dtype=torch.int8))
+        self.register_buffer('scales', torch.empty(out_features, dtype=dtype))
+        self.bias = nn.Parameter(torch.empty(out_features, dtype=dtype), requires_grad=False) if bias else None
+
+    @classmethod
+    def from_linear(cls, linear, dtype=torch.bfloat16):
+        module = cls(linear.in_features, linear.out_features, linear.bias is not None, dtype)
+        weight = linear.weight.detach().float()
+        scales = weight.abs().amax(dim=1).clamp(min=1e-8) / 127
+        module.weight.copy_(torch.round(weight / scales[:, None]).clamp(-128, 127).to(torch.int8))
+        module.scales.copy_(scales.to(dtype))
+        if linear.bias is not None:
+            module.bias.data.copy_(linear.bias.detach().to(dtype))
+        return module
+
+    def forward(self, x):
+        out = F.linear(x, self.weight.to(x.dtype)) * self.scales.to(x.dtype)
+        if self.bias is not None:
+            out = out + self.bias.to(x.dtype)
+        return out
+
+    def extra_repr(self):
+        return f'in_features={self.in_features}, out_features={self.out_features}, bias={self.bias is not None}'
+
+
+class WeightOnlyInt4Linear(nn.Module):
+    """
+    Linear layer with symmetric int4 weights, two values packed per uint8 and one scale per
+    group_size input channels of every output channel. Like WeightOnlyInt8Linear it dequantizes
+    the full weight in every forward, trading speed for weight memory.
+    """
+    def __init__(self, in_features, out_features, bias=True, group_size=128, dtype=torch.bfloat16):
+        super().__init__()
+        assert in_features % group_size == 0 and group_size % 2 == 0, \
+            f'in_features {in_features} must be a multiple of the even group_size {group_size}'
+        self.in_features = in_features
+        self.out_features = out_features
+        self.group_size = group_size
+        self.register_buffer('weight', torch.empty(out_features, in_features // 2, dtype=torch.uint8))
+        self.register_buffer('scales', torch.empty(out_features, in_features // group_size, dtype=dtype))
+        self.bias = nn.Parameter(torch.empty(out_features, dtype=dtype), requires_grad=False) if bias else None
+
+    @classmethod
+    def from_linear(cls, linear, group_size=128, dtype=torch.bfloat16):
+        module = cls(linear.in_features, linear.out_features, linear.bias is not None, group_size, dtype)
+        weight = linear.weight.detach().float().view(linear.out_features, -1, group_size)
+        scales = weight.abs().amax(dim=2).clamp(min=1e-8) / 7
+        q = torch.round(weight / scales[:, :, None]).clamp(-8, 7).to(torch.int16) + 8
+        q = q.view(linear.out_features, -1, 2)
+        module.weight.copy_((q[:, :, 0] | (q[:, :, 1] << 4)).to(torch.uint8))
+        module.scales.copy_(scales.to(dtype))
+        if linear.bias is not None:
+            module.bias.data.copy_(linear.bias.detach().to(dtype))
+        return module
+
+    def dequantize(self, dtype):
+        q = torch.stack([self.weight & 0xF, self.weight >> 4], dim=-1).view(self.out_features, -1, self.group_size)
+        weight = (q.to(dtype) - 8) * self.scales.to(dtype)[:, :, None]
+        return weight.view(self.out_features, self.in_features)
+
+    def forward(self, x):
+        out = F.linear(x, self.dequantize(x.dtype))
+        if self.bias is not None:
+            out = out + self.bias.to(x.dtype)
+        return out
+
+    def extra_repr(self):
+        return f'in_features={self.in_features}, out_features={self.out_features}, ' \
+               f'bias={self.bias is not None}, group_size={self.group_size}'
+
+
+def quantize_weight_only(model, bits=8, group_size=128, dtype=torch.bfloat16, skip_modules=('lm_head',)):
+    """
+    Replace the nn.Linear layers of model (language model, connector and vision tower) by weight-only
+    int8 or int4 layers computing in dtype. Layers whose name contains one of skip_modules are kept,
+    int4 layers fall back to int8 when in_features is not a multiple of group_size.
+    This shrinks the model for memory-bound CPU hosts, use bf16 when only speed matters.
+    """
+    assert bits in (4, 8), f'Unsupported number of bits: {bits}'
+    model.to(dtype)
+    for name, module in list(model.named_modules()):
+        for child_name, child in list(module.named_children()):
+            full_name = f'{name}.{child_name}' if name else child_name
+            if not isinstance(child, nn.Linear) or any(s in full_name for s in skip_modules):
+                continue
+            if bits == 4 and child.in_features % group_size == 0:
+                quantized = WeightOnlyInt4Linear.from_linear(child, group_size, dtype)
+            else:
+                quantized = WeightOnlyInt8Linear.from_linear(child, dtype)
+            setattr(module, child_name, quantized)
+    return model
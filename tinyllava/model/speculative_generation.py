@@ -0,0 +1,182 @@
+from collections import Counter
+
+import torch
+
+from .static_generation import STATIC_GENERATION_KWARGS, logits_to_probs, sample_next_token
+
+
+def forward_with_cache(language_model, past_key_values, input_ids=None, inputs_embeds=None):
+    """
+    Run the language model on the new tokens after the legacy past_key_values, return the logits of
+    the new positions and the legacy cache extended with them.
+    """
+    inputs = input_ids if input_ids is not None else inputs_embeds
+    past_len = 0 if past_key_values is None else past_key_values[0][0].shape[-2]
+    position_ids = torch.arange(past_len, past_len + inputs.shape[1], device=inputs.device)[None]
+    outputs = language_model(
+        input_ids=input_ids,
+        inputs_embeds=inputs_embeds,
+        position_ids=position_ids,
+        past_key_values=past_key_values,
+        use_cache=True,
+        return_dict=True,
+    )
+    past_key_values = outputs.past_key_values
+    if hasattr(past_key_values, 'to_legacy_cache'):
+        past_key_values = past_key_values.to_legacy_cache()
+    return outputs.logits, past_key_values
+
+
+def crop_past_key_values(past_key_values, length):
+    return tuple(tuple(t[:, :, :length] for t in layer) for layer in past_key_values)
+
+
+class DraftModelDrafter:
+    """
+    Drafts tokens with a smaller TinyLlavaForConditionalGeneration using the same vision tower and
+    tokenizer as the main model, e.g. a qwen2-0.5B run for a qwen2-1.5B one. The draft model encodes
+    the image with its own connector and keeps its own KV cache, cropped to the accepted tokens.
+    """
+    def __init__(self, model, draft_model):
+        assert draft_model.config.vision_model_name_or_path == model.config.vision_model_name_or_path, \
+            'the draft model must use the vision tower of the main model'
+        assert draft_model.tokenizer.get_vocab() == model.tokenizer.get_vocab(), \
+            'the draft model must use the tokenizer of the main model'
+        self.model = draft_model
+        self.language_model = draft_model.language_model
+        self.past_key_values = None
+
+    def prefill(self, input_ids, images=None, image_sizes=None):
+        inputs_embeds = self.model.get_inputs_embeds(input_ids, images, image_sizes)
+        _, self.past_key_values = forward_with_cache(self.language_model, None, inputs_embeds=inputs_embeds)
+        self.prompt_len = inputs_embeds.shape[1]
+        # number of generated tokens in the draft cache
+        self.num_seen = 0
+
+    def propose(self, output_ids, num_tokens, do_sample=False, temperature=1.0, top_p=None):
+        """
+        Return num_tokens draft tokens following output_ids and, when sampling, their draft distributions.
+        """
+        next_input = torch.tensor([output_ids[self.num_seen:]], device=self.model.device)
+        tokens, probs = [], []
+        for _ in range(num_tokens):
+            logits, self.past_key_values = forward_with_cache(self.language_model, self.past_key_values,
+                                                              input_ids=next_input)
+            logits = logits[:, -1]
+            if do_sample:
+                probs.append(logits_to_probs(logits, temperature, top_p)[0])
+                next_input = torch.multinomial(probs[-1], num_samples=1)[None]
+            else:
+                next_input = logits.argmax(dim=-1, keepdim=True)
+            tokens.append(next_input.item())
+        if num_tokens > 0:
+            # the last draft token is not in the draft cache yet
+            self.num_seen = len(output_ids) + num_tokens - 1
+        return tokens, torch.stack(probs) if do_sample and num_tokens > 0 else None
+
+    def accept(self, num_previous, num_accepted):
+        self.num_seen = min(self.num_seen, num_previous + num_accepted)
+        self.past_key_values = crop_past_key_values(self.past_key_values, self.prompt_len + self.num_seen)
+
+    def release(self):
+        self.past_key_values = None
+
+
+class SpeculativeGenerator:
+    """
+    Speculative decoding: a drafter proposes num_draft_tokens tokens, the main model scores all of
+    them in one forward and keeps the longest prefix it agrees with plus one token of its own.
+    Greedy decoding returns exactly the tokens of greedy generate. With sampling the drafts are
+    accepted by rejection sampling, which keeps the main model distribution.
+    Handles batch size 1 greedy and top-p sampling requests, stats counts drafted and accepted tokens.
+    """
+    def __init__(self, model, drafter, num_draft_tokens=5):
+        self.model = model
+        self.language_model = model.language_model
+        self.drafter = drafter
+        self.num_draft_tokens = num_draft_tokens
+        self.stats = Counter()
+
+    @property
+    def acceptance_rate(self):
+        return self.stats['accepted'] / max(self.stats['drafted'], 1)
+
+    def can_generate(self, inputs, kwargs):
+        return (inputs.shape[0] == 1 and kwargs.get('num_beams', 1) == 1
+                and set(kwargs) <= STATIC_GENERATION_KWARGS)
+
+    def verify(self, logits, draft_tokens, draft_probs, do_sample, temperature, top_p):
+        """
+        Number of accepted draft tokens and the next token, from the main model logits [k + 1, vocab]
+        at the last accepted token and at the k draft tokens. draft_probs None means deterministic drafts.
+        """
+        if not do_sample:
+            predicted = logits.argmax(dim=-1).tolist()
+            num_accepted = 0
+            while num_accepted < len(draft_tokens) and draft_tokens[num_accepted] == predicted[num_accepted]:
+                num_accepted += 1
+            return num_accepted, predicted[num_accepted]
+
+        probs = logits_to_probs(logits, temperature, top_p)
+        for i, token in enumerate(draft_tokens):
+            p = probs[i]
+            if draft_probs is None:
+                q = torch.zeros_like(p)
+                q[token] = 1.
+            else:
+                vocab_size = min(p.shape[-1], draft_probs.shape[-1])
+                p, q = p[:vocab_size], draft_probs[i, :vocab_size]
+            if torch.rand(()).item() < (p[token] / q[token]).item():
+                continue
+            residual = (p - q).clamp(min=0)
+            residual = residual if residual.sum() > 0 else p
+            return i, torch.multinomial(residual / residual.sum(), num_samples=1).item()
+        return len(draft_tokens), torch.multinomial(probs[-1], num_samples=1).item()
+
+    @torch.inference_mode()
+    def generate(self, inputs_embeds, input_ids, images=None, image_sizes=None, max_new_tokens=512,
+                 do_sample=False, temperature=1.0, top_p=None, eos_token_id=None, streamer=None, **kwargs):
+        """
+        Decode from the multimodal prompt embeddings of the main model, the drafter gets the prompt ids
+        and images. Returns the generated token ids [1, new tokens] like the language model generate.
+        """
+        if eos_token_id is None:
+            eos_token_id = self.language_model.generation_config.eos_token_id
+        eos_token_ids = set(eos_token_id if isinstance(eos_token_id, list) else [eos_token_id])
+        do_sample = do_sample and temperature is not None and temperature >= 1e-5
+        if streamer is not None:
+            # the language model generate streams the (empty) input_ids of an inputs_embeds prompt first
+            streamer.put(torch.empty(1, 0, dtype=torch.long))
+
+        logits, past_key_values = forward_with_cache(self.language_model, None, inputs_embeds=inputs_embeds)
+        prompt_len = inputs_embeds.shape[1]
+        output_ids = [sample_next_token(logits[:, -1], do_sample, temperature, top_p).item()]
+        if streamer is not None:
+            streamer.put(torch.tensor(output_ids))
+        self.drafter.prefill(input_ids, images, image_sizes)
+
+        while len(output_ids) < max_new_tokens and output_ids[-1] not in eos_token_ids:
+            num_tokens = min(self.num_draft_tokens, max_new_tokens - len(output_ids) - 1)
+            draft_tokens, draft_probs = self.drafter.propose(output_ids, num_tokens, do_sample, temperature, top_p)
+            new_input = torch.tensor([output_ids[-1:] + draft_tokens], device=inputs_embeds.device)
+            logits, past_key_values = forward_with_cache(self.language_model, past_key_values, input_ids=new_input)
+            num_accepted, next_token = self.verify(logits[0], draft_tokens, draft_probs, do_sample, temperature, top_p)
+            self.stats['drafted'] += len(draft_tokens)
+            self.stats['accepted'] += num_accepted
+
+            self.drafter.accept(len(output_ids), num_accepted)
+            new_tokens = draft_tokens[:num_accepted] + [next_token]
+            for i, token in enumerate(new_tokens):
+                if token in eos_token_ids:
+                    new_tokens = new_tokens[:i + 1]
+                    break
+            output_ids += new_tokens
+            # the main cache holds the prompt and every generated token but the last one
+            past_key_values = crop_past_key_values(past_key_values, prompt_len + len(output_ids) - 1)
+            if streamer is not None:
+                streamer.put(torch.tensor(new_tokens))
+
+        self.drafter.release()
+        if streamer is not None:
+            streamer.end()
+        return torch.tensor([output_ids], device=inputs_embeds.device)
@@ -0,0 +1,150 @@
+import inspect
+
+import torch
+
+
+# generate kwargs the static decode loop handles, or ignores because they do not change its result
+STATIC_GENERATION_KWARGS = {'do_sample', 'temperature', 'top_p', 'max_new_tokens', 'streamer', 'eos_token_id',
+                            'pad_token_id', 'use_cache', 'num_beams'}
+
+
+def logits_to_probs(logits, temperature=1.0, top_p=None):
+    """
+    Sampling distribution of the logits [..., vocab] after temperature and top-p filtering.
+    """
+    logits = logits.float() / temperature
+    if top_p is not None and top_p < 1.0:
+        sorted_logits, sorted_indices = logits.sort(dim=-1, descending=True)
+        sorted_probs = sorted_logits.softmax(dim=-1)
+        # drop the tokens after the top_p mass, always keeping the most likely one
+        sorted_remove = sorted_probs.cumsum(dim=-1) - sorted_probs > top_p
+        logits = logits.masked_fill(sorted_remove.scatter(-1, sorted_indices, sorted_remove), float('-inf'))
+    return logits.softmax(dim=-1)
+
+
+def sample_next_token(logits, do_sample=False, temperature=1.0, top_p=None):
+    """
+    Pick the next token from the last position logits [b, vocab], greedily or by temperature / top-p sampling.
+    """
+    if not do_sample or temperature is None or temperature < 1e-5:
+        return logits.argmax(dim=-1)
+    return torch.multinomial(logits_to_probs(logits, temperature, top_p), num_samples=1)[:, 0]
+
+
+class StaticCacheGenerator:
+    """
+    Greedy and sampling generation for a TinyLlavaForConditionalGeneration with a KV cache preallocated
+    once and a compiled single token decode step, so decoding reuses the same buffers and CUDA graphs
+    instead of growing the cache. The cache holds max_position_embeddings tokens of the language model,
+    the length transformers sizes the causal mask of static caches by.
+
+    Only language models whose forward takes a cache_position and that set up static caches
+    (tinyllama, gemma) can use it. Other requests (beam search, other batch sizes, unsupported kwargs)
+    go through the language model generate: the static cache is released for them and allocated again
+    by the next request that uses it.
+    """
+    def __init__(self, model, batch_size=1, compile=True):
+        from transformers import StaticCache
+        self.model = model
+        self.language_model = model.language_model
+        self.max_cache_len = self.language_model.config.max_position_embeddings
+        self.batch_size = batch_size
+        self.cache_cls = StaticCache
+        self.cache_allocated = False
+        self.decode_step = self._decode_step
+        if compile:
+            # not fullgraph, parts of the transformers forward the compiler cannot capture run eagerly
+            self.decode_step = torch.compile(self._decode_step, mode='reduce-overhead')
+
+    @staticmethod
+    def is_supported(language_model):
+        return (hasattr(language_model, '_setup_cache')
+                and 'cache_position' in inspect.signature(language_model.forward).parameters)
+
+    def setup_cache(self):
+        if not self.cache_allocated:
+            self.language_model._setup_cache(self.cache_cls, self.batch_size, self.max_cache_len)
+            self.cache_allocated = True
+
+    def reset_cache(self):
+        if self.cache_allocated:
+            self.language_model._reset_cache()
+            self.cache_allocated = False
+
+    def can_generate(self, inputs, kwargs):
+        return (inputs.shape[0] == self.batch_size and inputs.shape[1] < self.max_cache_len
+                and kwargs.get('num_beams', 1) == 1 and set(kwargs) <= STATIC_GENERATION_KWARGS)
+
+    def attention_mask(self, cache_position, batch_size):
+        """
+        2D mask [b, max_cache_len] of the cache slots filled up to the last position, the language model
+        combines it with its causal mask. The later slots are empty or hold a previous request; while
+        any is left out the mask is not all ones, so sdpa does not drop it for single token steps.
+        """
+        slots = torch.arange(self.max_cache_len, device=cache_position.device)
+        return (slots <= cache_position[-1]).long()[None].expand(batch_size, -1)
+
+    def _decode_step(self, input_ids, cache_position):
+        return self.language_model(
+            input_ids=input_ids,
+            attention_mask=self.attention_mask(cache_position, input_ids.shape[0]),
+            position_ids=cache_position[None].expand(input_ids.shape[0], -1),
+            cache_position=cache_position,
+            use_cache=True,
+            return_dict=False,
+        )[0][:, -1]
+
+    def prefill(self, inputs_embeds):
+        cache_position = torch.arange(inputs_embeds.shape[1], device=inputs_embeds.device)
+        logits = self.language_model(
+            inputs_embeds=inputs_embeds,
+            attention_mask=self.attention_mask(cache_position, inputs_embeds.shape[0]),
+            position_ids=cache_position[None].expand(inputs_embeds.shape[0], -1),
+            cache_position=cache_position,
+            use_cache=True,
+            return_dict=False,
+        )[0][:, -1]
+        return logits, cache_position[-1:]
+
+    @torch.inference_mode()
+    def generate(self, inputs_embeds, max_new_tokens=512, do_sample=False, temperature=1.0, top_p=None,
+                 eos_token_id=None, streamer=None, **kwargs):
+        """
+        Decode from the multimodal prompt embeddings, return the generated token ids [b, new tokens]
+        like the language model generate called with inputs_embeds.
+        """
+        if eos_token_id is None:
+            eos_token_id = self.language_model.generation_config.eos_token_id
+        eos_token_ids = torch.tensor(eos_token_id if isinstance(eos_token_id, list) else [eos_token_id],
+                                     device=inputs_embeds.device)
+        max_new_tokens = min(max_new_tokens, self.max_cache_len - inputs_embeds.shape[1])
+
+        if streamer is not None:
+            # the language model generate streams the (empty) input_ids of an inputs_embeds prompt first
+            streamer.put(torch.empty(inputs_embeds.shape[0], 0, dtype=torch.long))
+        self.setup_cache()
+        logits, cache_position = self.prefill(inputs_embeds)
+        finished = torch.zeros(inputs_embeds.shape[0], dtype=torch.bool, device=inputs_embeds.device)
+        output_ids = []
+        for _ in range(max_new_tokens):
+            next_tokens = sample_next_token(logits, do_sample, temperature, top_p)
+            next_tokens = next_tokens.masked_fill(finished, eos_token_ids[0])
+            output_ids.append(next_tokens)
+            if streamer is not None:
+                streamer.put(next_tokens.cpu())
+            finished |= torch.isin(next_tokens, eos_token_ids)
+            if finished.all():
+                break
+            cache_position = cache_position + 1
+            # CUDA graph outputs are overwritten by the next replay
+            logits = self.decode_step(next_tokens[:, None], cache_position).clone()
+        if streamer is not None:
+            streamer.end()
+        return torch.stack(output_ids, dim=1)
+
+    def warmup(self, prompt_len=16, steps=4):
+        # compile and record the CUDA graphs of the decode step before the first request
+        hidden_size = self.language_model.get_input_embeddings().embedding_dim
+        inputs_embeds = torch.zeros(self.batch_size, prompt_len, hidden_size,
+                                    device=self.model.device, dtype=self.model.dtype)
+        self.generate(inputs_embeds, max_new_tokens=steps, eos_token_id=-1)
@@ -1,9 +1,9 @@
-import os
-
 import torch
 import torch.nn as nn
+import torch.utils.checkpoint
 
 from transformers import PreTrainedModel
+from ...utils.checkpoint_utils import load_component_state_dict
 # from tinyllava.utils.data_utils import get_value_from_kwargs
 
 def get_value_from_kwargs(kwargs, name):
@@ -12,7 +12,40 @@ def get_value_from_kwargs(kwargs, name):
     else:
         return None
 
+def forward_to_layer(model, pixel_values, layer):
+    """
+    Return hidden_states[layer] of a CLIP, SigLIP or DINOv2 vision model (as with output_hidden_states=True)
+    by running only the encoder layers up to it, without keeping the other hidden states. Gradient
+    checkpointing enabled on the model applies as in its own forward. Other models run the full forward.
+    """
+    model_type = getattr(model.config, 'model_type', None)
+    if model_type not in ('clip_vision_model', 'siglip_vision_model', 'dinov2'):
+        return model(pixel_values, output_hidden_states=True).hidden_states[layer]
+
+    vision_model = getattr(model, 'vision_model', model)
+    encoder = vision_model.encoder
+    layers = encoder.layer if model_type == 'dinov2' else encoder.layers
+    # hidden_states[0] is the input of the first layer, hidden_states[i] the output of layer i - 1
+    num_layers = layer if layer >= 0 else len(layers) + 1 + layer
+    hidden_states = vision_model.embeddings(pixel_values)
+    if model_type == 'clip_vision_model':
+        hidden_states = vision_model.pre_layrnorm(hidden_states)
+    # attention masks of the CLIP and SigLIP layers, DINOv2 layers take none
+    mask_args = {'clip_vision_model': (None, None), 'siglip_vision_model': (None,), 'dinov2': ()}[model_type]
+    checkpointing = getattr(encoder, 'gradient_checkpointing', False) and model.training
+    checkpoint = getattr(encoder, '_gradient_checkpointing_func', torch.utils.checkpoint.checkpoint)
+    for encoder_layer in layers[:num_layers]:
+        if checkpointing:
+            hidden_states = checkpoint(encoder_layer.__call__, hidden_states, *mask_args)[0]
+        else:
+            hidden_states = encoder_layer(hidden_states, *mask_args)[0]
+    return hidden_states
+
+
 class VisionTower(nn.Module):
+    # stop the forward at vision_feature_layer instead of running every layer with output_hidden_states
+    early_exit = True
+
     def __init__(self, cfg):
         super().__init__()
         self._vision_tower = None
@@ -35,7 +68,7 @@ class VisionTower(nn.Module):
             self._vision_tower = self._vision_tower.from_pretrained(vision_tower_name, **kwargs)      
         else: # nn.Module
             if pretrained_vision_tower_path is not None:
-                vision_tower_weights = torch.load(os.path.join(pretrained_vision_tower_path, 'pytorch_model.bin'), map_location='cpu')
+                vision_tower_weights = load_component_state_dict(pretrained_vision_tower_path)
                 def get_w(weights, keyword):
                     return {k.split(keyword + '.')[1]: v for k, v in weights.items() if keyword in k}
                 self._vision_tower.load_state_dict(vision_tower_weights)
@@ -45,8 +78,11 @@ class VisionTower(nn.Module):
 
 
     def forward(self, x, **kwargs):
-        image_features = self._vision_tower(x, output_hidden_states=True)
-        image_features = image_features.hidden_states[kwargs.get('vision_feature_layer', -2)]
+        if self.early_exit:
+            image_features = forward_to_layer(self._vision_tower, x, kwargs.get('vision_feature_layer', -2))
+        else:
+            image_features = self._vision_tower(x, output_hidden_states=True)
+            image_features = image_features.hidden_states[kwargs.get('vision_feature_layer', -2)]
 
         if kwargs.get('vision_feature_select_strategy', 'patch') == 'patch':
             image_features = image_features[:, 1:]
@@ -4,7 +4,8 @@ import torch.nn as nn
 from transformers import CLIPVisionModel, CLIPImageProcessor, CLIPVisionConfig, Dinov2Model, AutoConfig
 
 from . import register_vision_tower
-from .base import VisionTower
+from ...utils.checkpoint_utils import load_component_state_dict
+from .base import VisionTower, forward_to_layer
 
 
 
@@ -17,6 +18,7 @@ class MoF(nn.Module):
 
         cfg_dinov2 = AutoConfig.from_pretrained(cfg.model_name_or_path2)
         self.dinov2 = Dinov2Model(cfg_dinov2)
+        self._clip_stream = None
 
 
 #     def enable_input_require_grads(self):
@@ -35,12 +37,22 @@ class MoF(nn.Module):
 
 
     def forward(self, x, **kwargs):
- 
-        image_features_clip = self.clip(x, output_hidden_states=True)
-        image_features_clip = image_features_clip.hidden_states[kwargs.get('vision_feature_layer', -2)]
-
-        image_features_dinov2 = self.dinov2(x, output_hidden_states=True)
-        image_features_dinov2 = image_features_dinov2.hidden_states[kwargs.get('vision_feature_layer', -2)]
+        vision_feature_layer = kwargs.get('vision_feature_layer', -2)
+        if x.is_cuda:
+            # CLIP runs on a side stream while DINOv2 runs on the current one
+            current_stream = torch.cuda.current_stream(x.device)
+            if self._clip_stream is None or self._clip_stream.device != x.device:
+                self._clip_stream = torch.cuda.Stream(x.device)
+            self._clip_stream.wait_stream(current_stream)
+            with torch.cuda.stream(self._clip_stream):
+                image_features_clip = forward_to_layer(self.clip, x, vision_feature_layer)
+            image_features_dinov2 = forward_to_layer(self.dinov2, x, vision_feature_layer)
+            current_stream.wait_stream(self._clip_stream)
+            x.record_stream(self._clip_stream)
+            image_features_clip.record_stream(current_stream)
+        else:
+            image_features_clip = forward_to_layer(self.clip, x, vision_feature_layer)
+            image_features_dinov2 = forward_to_layer(self.dinov2, x, vision_feature_layer)
 
         if kwargs.get('vision_feature_select_strategy', 'patch') == 'patch':
             image_features_clip = image_features_clip[:, 1:]
@@ -81,7 +93,7 @@ class MoFVisionTower(VisionTower):
             print("Loading vision tower2 from ", model_name_or_path_dinov2)
         else: # nn.Module
             if pretrained_vision_tower_path is not None:
-                vision_tower_weights = torch.load(os.path.join(pretrained_vision_tower_path, 'pytorch_model.bin'), map_location='cpu')
+                vision_tower_weights = load_component_state_dict(pretrained_vision_tower_path)
                 def get_w(weights, keyword):
                     return {k.split(keyword + '.')[1]: v for k, v in weights.items() if keyword in k}
                 self._vision_tower.load_state_dict(vision_tower_weights)
@@ -89,8 +101,6 @@ class MoFVisionTower(VisionTower):
 
 
     def forward(self, x, **kwargs):
-        device = x.data.device
-        self.to(device)
         return self._vision_tower(x, **kwargs)
 
 
@@ -332,6 +332,10 @@ def parse_args():
     parser.add_argument("--model-name", type=str, default=DEFAULT_MODEL_PATH.split('/')[-1])
     parser.add_argument("--load-8bit", action="store_true")
     parser.add_argument("--load-4bit", action="store_true")
+    parser.add_argument("--draft-model-path", type=str, default=None, help="smaller model for speculative decoding")
+    parser.add_argument("--num-draft-tokens", type=int, default=5)
+    parser.add_argument("--prompt-lookup", action="store_true", help="speculative decoding with prompt lookup drafts")
+    parser.add_argument("--phrase-bank", type=str, default=None, help="phrase bank for --prompt-lookup, see scripts/build_phrase_bank.py")
     args = parser.parse_args()
     return args
 
@@ -351,6 +355,13 @@ if __name__ == "__main__":
         load_8bit=args.load_8bit
     )
     model.to(args.device)
+    if args.draft_model_path is not None:
+        draft_model = load_pretrained_model(args.draft_model_path)[0]
+        draft_model.to(args.device)
+        model.enable_speculative_generation(draft_model, args.num_draft_tokens)
+    elif args.prompt_lookup:
+        phrase_bank = PhraseBank.load(args.phrase_bank) if args.phrase_bank is not None else None
+        model.enable_speculative_generation(PromptLookupDrafter(phrase_bank), args.num_draft_tokens)
     image_processor = ImagePreprocess(image_processor, model.config)
     text_processor = TextPreprocess(tokenizer, args.conv_mode)
     demo = build_demo()
@@ -7,7 +7,6 @@
 '''
 import argparse
 import requests
-from PIL import Image
 from io import BytesIO
 
 import torch
@@ -18,12 +17,12 @@ from tinyllava.data import *
 from tinyllava.model import *
 
 
-def load_image(image_file):
+def load_image(image_file, min_size=None):
     if image_file.startswith('http://') or image_file.startswith('https://'):
         response = requests.get(image_file)
-        image = Image.open(BytesIO(response.content)).convert('RGB')
+        image = open_image(BytesIO(response.content), min_size)
     else:
-        image = Image.open(image_file).convert('RGB')
+        image = open_image(image_file, min_size)
     return image
 
 
@@ -31,7 +30,7 @@ def main(args):
     # Model
     disable_torch_init()
     if args.model_path is not None:
-        model, tokenizer, image_processor, context_len = load_pretrained_model(model_name_or_path=args.model_path, load_8bit=args.load_8bit, load_4bit=args.load_4bit, device=args.device)
+        model, tokenizer, image_processor, context_len = load_pretrained_model(model_name_or_path=args.model_path, load_8bit=args.load_8bit, load_4bit=args.load_4bit, device=args.device, cpu_quantization=args.cpu_quantization, image_token_reduction=args.image_token_reduction)
     else:
         assert args.model is not None, 'model_path or model must be provided'
         model = args.model
@@ -46,15 +45,22 @@ def main(args):
     data_args = model.config
     image_processor = ImagePreprocess(image_processor, data_args)
     model.to(args.device)
+    if args.draft_model_path is not None:
+        draft_model = load_pretrained_model(args.draft_model_path)[0]
+        draft_model.to(args.device)
+        model.enable_speculative_generation(draft_model, args.num_draft_tokens)
+    elif args.prompt_lookup:
+        phrase_bank = PhraseBank.load(args.phrase_bank) if args.phrase_bank is not None else None
+        model.enable_speculative_generation(PromptLookupDrafter(phrase_bank), args.num_draft_tokens)
     if getattr(text_processor.template, 'role', None) is None:
         roles = ['USER', 'ASSISTANT']
     else:
         roles = text_processor.template.role.apply()
     msg = Message()
-    image = load_image(args.image_file)
+    image = load_image(args.image_file, image_processor.decode_size)
     # Similar operation in model_worker.py
     image_tensor = image_processor(image)
-    image_tensor = image_tensor.unsqueeze(0).to(model.device, dtype=torch.float16)
+    image_tensor = image_tensor.unsqueeze(0).to(model.device, dtype=model.dtype)
 
     while True:
         try:
@@ -102,6 +108,8 @@ def main(args):
 
         if args.debug:
             print("\n", {"prompt": prompt, "outputs": outputs}, "\n")
+            if model._speculative_generator is not None:
+                print(f"draft acceptance rate: {model._speculative_generator.acceptance_rate:.2f}")
 
 
 if __name__ == "__main__":
@@ -115,6 +123,13 @@ if __name__ == "__main__":
     parser.add_argument("--max-new-tokens", type=int, default=512)
     parser.add_argument("--load-8bit", action="store_true")
     parser.add_argument("--load-4bit", action="store_true")
+    parser.add_argument("--cpu-quantization", type=str, default=None, choices=["bf16", "int8", "int4"],
+                        help="int8 and int4 reduce weight memory, they are not faster than bf16")
+    parser.add_argument("--image-token-reduction", type=str, default=None, help="e.g. pool4 or merge2, for mlp connectors")
+    parser.add_argument("--draft-model-path", type=str, default=None, help="smaller model for speculative decoding")
+    parser.add_argument("--num-draft-tokens", type=int, default=5)
+    parser.add_argument("--prompt-lookup", action="store_true", help="speculative decoding with prompt lookup drafts")
+    parser.add_argument("--phrase-bank", type=str, default=None, help="phrase bank for --prompt-lookup, see scripts/build_phrase_bank.py")
     parser.add_argument("--debug", action="store_true")
     args = parser.parse_args()
     main(args)
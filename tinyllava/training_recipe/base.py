@@ -113,16 +113,18 @@ class BaseTrainingRecipe:
         if trainer.args.local_rank == 0 or trainer.args.local_rank == -1:
             language_model_output_dir = os.path.join(self.training_arguments.output_dir, 'language_model')
             os.makedirs(language_model_output_dir, exist_ok=True)
-            language_model_output_path = os.path.join(self.training_arguments.output_dir, 'language_model/pytorch_model.bin')
-            torch.save(language_model_state_dict, language_model_output_path)
+            save_component_state_dict(language_model_state_dict, language_model_output_dir,
+                                      safe_serialization=self.training_arguments.save_safetensors,
+                                      max_shard_size=self.training_arguments.component_max_shard_size)
             model.config.text_config.save_pretrained(language_model_output_dir, from_pt=True)
         #save vision tower
         vision_tower_state_dict = get_state_maybe_zero_3(model.vision_tower._vision_tower.named_parameters(), [''], False)
         if trainer.args.local_rank == 0 or trainer.args.local_rank == -1:
             vision_tower_output_dir = os.path.join(self.training_arguments.output_dir, 'vision_tower')
             os.makedirs(vision_tower_output_dir, exist_ok=True)
-            vision_tower_output_path = os.path.join(self.training_arguments.output_dir, 'vision_tower/pytorch_model.bin')
-            torch.save(vision_tower_state_dict, vision_tower_output_path)
+            save_component_state_dict(vision_tower_state_dict, vision_tower_output_dir,
+                                      safe_serialization=self.training_arguments.save_safetensors,
+                                      max_shard_size=self.training_arguments.component_max_shard_size)
             if isinstance(model.vision_tower._vision_tower, PreTrainedModel):
                 model.vision_tower._vision_tower.config.save_pretrained(vision_tower_output_dir, from_pt=True)
         #save connector
@@ -130,8 +132,9 @@ class BaseTrainingRecipe:
         if trainer.args.local_rank == 0 or trainer.args.local_rank == -1:
             connector_output_dir = os.path.join(self.training_arguments.output_dir, 'connector')
             os.makedirs(connector_output_dir, exist_ok=True)
-            connector_output_path = os.path.join(self.training_arguments.output_dir, 'connector/pytorch_model.bin')
-            torch.save(connector_state_dict, connector_output_path)
+            save_component_state_dict(connector_state_dict, connector_output_dir,
+                                      safe_serialization=self.training_arguments.save_safetensors,
+                                      max_shard_size=self.training_arguments.component_max_shard_size)
     
 
     def load(self, model, model_args={}):
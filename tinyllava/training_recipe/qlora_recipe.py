@@ -11,7 +11,7 @@ from peft.tuners.lora import LoraLayer
 from .base import BaseTrainingRecipe
 from . import register_training_recipe
 from ..utils.train_utils import *
-from ..utils import log
+from ..utils import log, save_component_state_dict
 from ..model import TinyLlavaConfig, TinyLlavaForConditionalGeneration
 
 
@@ -81,24 +81,27 @@ class QLoRAInt8TrainingRecipe(BaseTrainingRecipe):
         if trainer.args.local_rank == 0 or trainer.args.local_rank == -1:
             language_model_output_dir = os.path.join(self.training_arguments.output_dir, 'language_model')
             os.makedirs(language_model_output_dir, exist_ok=True)
-            language_model_output_path = os.path.join(self.training_arguments.output_dir, 'language_model/pytorch_model.bin')
-            torch.save(language_model_state_dict, language_model_output_path)
+            save_component_state_dict(language_model_state_dict, language_model_output_dir,
+                                      safe_serialization=self.training_arguments.save_safetensors,
+                                      max_shard_size=self.training_arguments.component_max_shard_size)
             model.config.text_config.save_pretrained(language_model_output_dir, from_pt=True)
         #save vision tower base params
         vision_tower_state_dict = get_peft_state_non_lora_maybe_zero_3(model.vision_tower._vision_tower.named_parameters(), False)
         if trainer.args.local_rank == 0 or trainer.args.local_rank == -1:
             vision_tower_output_dir = os.path.join(self.training_arguments.output_dir, 'vision_tower')
             os.makedirs(vision_tower_output_dir, exist_ok=True)
-            vision_tower_output_path = os.path.join(self.training_arguments.output_dir, 'vision_tower/pytorch_model.bin')
-            torch.save(vision_tower_state_dict, vision_tower_output_path)
+            save_component_state_dict(vision_tower_state_dict, vision_tower_output_dir,
+                                      safe_serialization=self.training_arguments.save_safetensors,
+                                      max_shard_size=self.training_arguments.component_max_shard_size)
             model.config.vision_config.save_pretrained(vision_tower_output_dir, from_pt=True)
         #save connector base params
         connector_state_dict = get_peft_state_non_lora_maybe_zero_3(model.connector.named_parameters(),  False)
         if trainer.args.local_rank == 0 or trainer.args.local_rank == -1:
             connector_output_dir = os.path.join(self.training_arguments.output_dir, 'connector')
             os.makedirs(connector_output_dir, exist_ok=True)
-            connector_output_path = os.path.join(self.training_arguments.output_dir, 'connector/pytorch_model.bin')
-            torch.save(connector_state_dict, connector_output_path)
+            save_component_state_dict(connector_state_dict, connector_output_dir,
+                                      safe_serialization=self.training_arguments.save_safetensors,
+                                      max_shard_size=self.training_arguments.component_max_shard_size)
         # save lora params
         lora_state_dict = get_peft_state_maybe_zero_3(
             model.named_parameters(), self.training_arguments.lora_bias
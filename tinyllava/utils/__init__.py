@@ -3,6 +3,7 @@ from .constants import *
 from .import_module import *
 from .logging import *
 from .train_utils import *
+from .checkpoint_utils import *
 from .message import *
 from .eval_utils import *
 from .data_utils import *
@@ -30,7 +30,7 @@ class ModelArguments:
                 "Maximum sequence length. Sequences will be right padded (and possibly truncated)."
         },
     )
-    tokenizer_use_fast: bool = field(default=False)
+    tokenizer_use_fast: bool = field(default=True)
     tokenizer_padding_side: str = field(default='right')
 
 
@@ -43,6 +43,8 @@ class DataArguments:
     image_folder: Optional[str] = field(default=None)
     image_aspect_ratio: str = 'square'
     conv_version: str = 'pretrain'
+    image_cache_dir: Optional[str] = field(default=None,
+                                           metadata={"help": "Directory of a memory-mapped cache of the resized images."})
 
 
 @dataclass
@@ -77,6 +79,10 @@ class TrainingArguments(transformers.TrainingArguments):
     group_by_modality_length: bool = field(default=False)
     vision_tower_lr: Optional[float] = None
     pretrained_model_path: Optional[str] = field(default=None)
+    component_max_shard_size: Optional[str] = field(
+        default=None,
+        metadata={"help": "Shard the language_model/vision_tower/connector safetensors checkpoints, e.g. '2GB'."}
+    )
     
     
     
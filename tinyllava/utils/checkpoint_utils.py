@@ -0,0 +1,57 @@
+import json
+import os
+
+import torch
+from safetensors.torch import load_file, save_file
+from transformers.modeling_utils import shard_checkpoint
+from transformers.utils import SAFE_WEIGHTS_INDEX_NAME, SAFE_WEIGHTS_NAME, WEIGHTS_NAME
+
+
+def save_component_state_dict(state_dict, output_dir, safe_serialization=True, max_shard_size=None):
+    """
+    Save the state dict of a model component (language_model, vision_tower, connector) to output_dir,
+    as model.safetensors, as shards with a model.safetensors.index.json when max_shard_size is given
+    (e.g. '2GB'), or as pytorch_model.bin when safe_serialization is False.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if not safe_serialization:
+        torch.save(state_dict, os.path.join(output_dir, WEIGHTS_NAME))
+        return
+    state_dict = {k: v.contiguous() for k, v in state_dict.items()}
+    if max_shard_size is None:
+        save_file(state_dict, os.path.join(output_dir, SAFE_WEIGHTS_NAME), metadata={'format': 'pt'})
+        return
+    shards, index = shard_checkpoint(state_dict, max_shard_size=max_shard_size, weights_name=SAFE_WEIGHTS_NAME)
+    for shard_file, shard in shards.items():
+        save_file(shard, os.path.join(output_dir, shard_file), metadata={'format': 'pt'})
+    if index is not None:
+        with open(os.path.join(output_dir, SAFE_WEIGHTS_INDEX_NAME), 'w') as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+
+
+def load_component_state_dict(ckp_dir, device='cpu', dtype=None):
+    """
+    Load the state dict of a model component saved by save_component_state_dict.
+    safetensors files are memory mapped and materialized directly on device, pytorch_model.bin
+    checkpoints of older runs are read into host memory.
+    """
+    index_path = os.path.join(ckp_dir, SAFE_WEIGHTS_INDEX_NAME)
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            files = sorted(set(json.load(f)['weight_map'].values()))
+    elif os.path.exists(os.path.join(ckp_dir, SAFE_WEIGHTS_NAME)):
+        files = [SAFE_WEIGHTS_NAME]
+    else:
+        files = None
+
+    if files is None:
+        state_dict = torch.load(os.path.join(ckp_dir, WEIGHTS_NAME), map_location='cpu')
+        state_dict = {k: v.to(device) for k, v in state_dict.items()}
+    else:
+        state_dict = {}
+        for file in files:
+            state_dict.update(load_file(os.path.join(ckp_dir, file), device=str(device)))
+
+    if dtype is not None:
+        state_dict = {k: v.to(dtype) if v.is_floating_point() else v for k, v in state_dict.items()}
+    return state_dict
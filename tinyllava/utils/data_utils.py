@@ -107,6 +107,27 @@ def resize_and_pad_image(image, target_resolution):
 
     return new_image
 
+def open_image(image_file, min_size=None, keep_grayscale=False):
+    """
+    Open and decode an image, JPEGs directly at a reduced resolution that keeps both sides at least min_size.
+
+    Args:
+        image_file (str or file): Path or file object of the image.
+        min_size (int, optional): Smallest side length needed downstream, full resolution if None.
+        keep_grayscale (bool): Return grayscale images single-channel instead of converting them to RGB.
+
+    Returns:
+        PIL.Image.Image: The decoded RGB (or L) image.
+    """
+    image = Image.open(image_file)
+    if min_size is not None:
+        # PIL draft mode lets libjpeg downscale by 1/2, 1/4 or 1/8 in the DCT domain
+        image.draft(None, (min_size, min_size))
+    if keep_grayscale and image.mode in ('L', 'I', 'I;16'):
+        return image.convert('L')
+    # grayscale X-rays stay single-channel until this conversion at the reduced resolution
+    return image.convert('RGB')
+
 def get_value_from_kwargs(kwargs, name):
     if name in kwargs:
         return kwargs.pop(name)
@@ -12,6 +12,8 @@ def disable_torch_init():
     """
     setattr(torch.nn.Linear, "reset_parameters", lambda self: None)
     setattr(torch.nn.LayerNorm, "reset_parameters", lambda self: None)
+    setattr(torch.nn.Conv2d, "reset_parameters", lambda self: None)
+    setattr(torch.nn.Embedding, "reset_parameters", lambda self: None)
  
 class KeywordsStoppingCriteria(StoppingCriteria):
     def __init__(self, keywords, tokenizer, input_ids):